@@ -1,19 +1,23 @@
 import re
+import sys
+import optparse
 import warnings
+from io import BytesIO
 from copy import deepcopy
 import numpy as np
+from lxml import etree
 import obspy.core.event
 from obspy import UTCDateTime
+from obspy.core.util import AttribDict
 from obspy.core.event import WaveformStreamID, ResourceIdentifier, \
-    TimeWindow, CreationInfo, Comment, OriginQuality
+    TimeWindow, CreationInfo, Comment, OriginQuality, QuantityError, \
+    EventDescription, CompositeTime
 
 ID_ROOT = "smi:de.erdbeben-in-bayern"
 AGENCY_ID = "Erdbebendienst Bayern"
 AGENCY_URI = "%s/agency" % ID_ROOT
-# these classes get subclassed and need to be patched in readEvents
-CLASSES_TO_PATCH = ['FocalMechanism',
-    'StationMagnitudeContribution', 'StationMagnitude', 'Magnitude', 'Catalog',
-    'Event', 'Origin', 'Pick', 'Arrival', 'Amplitude']
+QUAKEML_NAMESPACES = ("http://quakeml.org/xmlns/quakeml/1.2",
+                      "http://quakeml.org/xmlns/bed/1.2")
 
 
 def camelcase2lower(name):
@@ -33,50 +37,81 @@ class CommonEventHelper():
     """
     Some common helper methods for Event type classes.
     """
-    def newID(self):
+    def newID(self, resource_id=None):
         """
-        Set new resource_id.
+        Set new resource_id (or the given one, e.g. when reading QuakeML).
         """
-        class_name = camelcase2lower(self.__class__.__name__)
-        self.resource_id = newResourceIdentifier(class_name)
+        if resource_id is None:
+            class_name = camelcase2lower(self.__class__.__name__)
+            resource_id = newResourceIdentifier(class_name)
+        self.resource_id = resource_id
+
+    def setModified(self, modified=True):
+        """
+        Mark object as changed, it gets a new resource_id at the next commit
+        point (see :meth:`commitID`).
+
+        The flag is kept in a slot (classes using it declare
+        `__slots__ = ("_modified", )`), AttribDict stores everything set as
+        an attribute in the instance dictionary, i.e. as one of its items.
+        """
+        object.__setattr__(self, "_modified", modified)
+
+    def isModified(self):
+        try:
+            return object.__getattribute__(self, "_modified")
+        except AttributeError:
+            return False
+
+    def commitID(self):
+        """
+        Set new resource_id if the object was changed since it got its
+        current one.
+
+        :returns: True if a new resource_id was set.
+        """
+        if not self.isModified():
+            return False
+        self.newID()
+        return True
 
 
 class FocalMechanism(obspy.core.event.FocalMechanism, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(FocalMechanism, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class StationMagnitudeContribution(
         obspy.core.event.StationMagnitudeContribution, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(StationMagnitudeContribution, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class StationMagnitude(obspy.core.event.StationMagnitude, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(StationMagnitude, self).__init__()
         self.used = True
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class Magnitude(obspy.core.event.Magnitude, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(Magnitude, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class Catalog(obspy.core.event.Catalog, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(Catalog, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class Event(obspy.core.event.Event, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(Event, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
     def set_creation_info(self, username, agency_id=AGENCY_ID,
                           agency_uri=AGENCY_URI):
@@ -90,31 +125,61 @@ class Event(obspy.core.event.Event, CommonEventHelper):
 class Origin(obspy.core.event.Origin, CommonEventHelper):
     def __init__(self, *args, **kwargs):
         super(Origin, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
 
 class Pick(obspy.core.event.Pick, CommonEventHelper):
+    # kept out of AttribDict's items, see CommonEventHelper.setModified
+    __slots__ = ("_modified", "_indexes")
+
     def __init__(self, seed_string=None, phase_hint=None, *args, **kwargs):
         super(Pick, self).__init__()
         if seed_string:
             self.waveform_id = WaveformStreamID(seed_string=seed_string)
         if phase_hint:
             self.phase_hint = phase_hint
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
 
     def __setattr__(self, name, value):
         """
-        Set new resource_id on any attribute change (other than setting a new
-        resource_id).
+        Mark pick as changed on any attribute change (other than setting a
+        new resource_id), so that it gets a new resource_id at the next
+        commit point (see :meth:`commitID`).
 
         XXX TODO if we do all attribute changes in setter methods here, we can
         probably take care of this in the setter methods and avoid this
         override?!
         """
         if name != "resource_id":
-            self.newID()
+            self.setModified()
+        else:
+            self.setModified(False)
+            for index in self.getIndexes():
+                index.invalidate()
         return super(Pick, self).__setattr__(name, value)
 
+    def getIndexes(self):
+        """
+        Returns list of the hash indexes (:class:`ListIndex`) holding the
+        pick, they get invalidated when the resource_id of the pick changes.
+        """
+        try:
+            return object.__getattribute__(self, "_indexes")
+        except AttributeError:
+            indexes = []
+            object.__setattr__(self, "_indexes", indexes)
+            return indexes
+
+    def addIndex(self, index):
+        indexes = self.getIndexes()
+        if index not in indexes:
+            indexes.append(index)
+
+    def removeIndex(self, index):
+        indexes = self.getIndexes()
+        if index in indexes:
+            indexes.remove(index)
+
     def setTime(self, time):
         self.time = time
 
@@ -130,43 +195,51 @@ class Pick(obspy.core.event.Pick, CommonEventHelper):
             self.time_errors.lower_uncertainty = delta
         elif time > self.time:
             self.time_errors.upper_uncertainty = delta
-        # changing a subproperty, need to manually set new resource_id
-        self.newID()
+        # changing a subproperty, need to manually mark pick as changed
+        self.setModified()
 
 
 class Arrival(obspy.core.event.Arrival, CommonEventHelper):
     def __init__(self, origin=None, pick=None, *args, **kwargs):
         super(Arrival, self).__init__()
-        self.newID()
+        self.newID(kwargs.get("resource_id"))
         if origin:
             origin.arrivals.append(self)
         if pick:
+            # make sure a changed pick gets its new resource_id first
+            pick.commitID()
             self.pick_id = pick.resource_id
 
 
 class Amplitude(obspy.core.event.Amplitude, CommonEventHelper):
+    # kept out of AttribDict's items, see CommonEventHelper.setModified
+    __slots__ = ("_modified", )
+
     def __init__(self, seed_string=None, *args, **kwargs):
         super(Amplitude, self).__init__()
         if seed_string:
             self.waveform_id = WaveformStreamID(seed_string=seed_string)
-        self.newID()
         self.low = None
         self.high = None
         self.low_time = None
         self.high_time = None
         self.time_window = TimeWindow()
+        self.newID(kwargs.get("resource_id"))
 
     def __setattr__(self, name, value):
         """
-        Set new resource_id on any attribute change (other than setting a new
-        resource_id).
+        Mark amplitude as changed on any attribute change (other than setting
+        a new resource_id), so that it gets a new resource_id at the next
+        commit point (see :meth:`commitID`).
 
         XXX TODO if we do all attribute changes in setter methods here, we can
         probably take care of this in the setter methods and avoid this
         override?!
         """
         if name != "resource_id":
-            self.newID()
+            self.setModified()
+        else:
+            self.setModified(False)
         return super(Amplitude, self).__setattr__(name, value)
 
     def setLow(self, time, value):
@@ -191,13 +264,13 @@ class Amplitude(obspy.core.event.Amplitude, CommonEventHelper):
         if begin == 0 and end > 0:
             t_max = t_min + end
             tr = tr.trim(t_min, t_max, nearest_sample=True)
-            self.low = tr.data[0]
-            self.high = tr.data[-1]
+            self.low = float(tr.data[0])
+            self.high = float(tr.data[-1])
         elif end == 0 and begin > 0:
             t_max = t_min - begin
             tr = tr.trim(t_max, t_min, nearest_sample=True)
-            self.low = tr.data[-1]
-            self.high = tr.data[0]
+            self.low = float(tr.data[-1])
+            self.high = float(tr.data[0])
         else:
             raise NotImplementedError()
         self.updateValue()
@@ -264,22 +337,432 @@ class Amplitude(obspy.core.event.Amplitude, CommonEventHelper):
         self.comments = [Comment(text="peak-to-peak amplitude in raw counts")]
 
 
-local = locals()
+class ListIndex(object):
+    """
+    Hash index on a list of event objects (e.g. the picks of an event).
+    For every key function a dictionary maps the key of each object to the
+    list of objects with that key, in the order they appear in the indexed
+    list. So the first object returned for a key is the same a linear scan
+    of the list would find first.
+
+    The index has to be told about objects appended to or removed from the
+    list (:meth:`add`, :meth:`remove`). :meth:`is_valid` detects a replaced
+    list (e.g. after loading another event), a changed number of objects or
+    an invalidated index (e.g. because keys of indexed objects changed, see
+    :meth:`Pick.getIndexes`), in which case the index should be rebuilt.
+    """
+    def __init__(self, keyfuncs, watch=False):
+        """
+        :type keyfuncs: dict
+        :param keyfuncs: Mapping of index names to functions returning the
+            (hashable) key of an object for that index.
+        :param watch: Whether indexed objects invalidate the index when
+            their keys change (objects have to provide `addIndex` and
+            `removeIndex`, see :class:`Pick`). Otherwise keys of indexed
+            objects must not change.
+        """
+        self.keyfuncs = keyfuncs
+        self.watch = watch
+        self.items = []
+        self.rebuild([])
+
+    def rebuild(self, items):
+        if self.watch:
+            for item in self.items:
+                item.removeIndex(self)
+        self.items = items
+        self.stale = False
+        self.count = 0
+        self.indexes = dict((name, {}) for name in self.keyfuncs)
+        for item in items:
+            self.add(item)
+
+    def invalidate(self):
+        self.stale = True
+
+    def is_valid(self, items):
+        return items is self.items and len(items) == self.count and \
+            not self.stale
+
+    def add(self, item):
+        for name, keyfunc in self.keyfuncs.iteritems():
+            self.indexes[name].setdefault(keyfunc(item), []).append(item)
+        if self.watch:
+            item.addIndex(self)
+        self.count += 1
+
+    def remove(self, item):
+        for name, keyfunc in self.keyfuncs.iteritems():
+            key = keyfunc(item)
+            bucket = self.indexes[name].get(key, [])
+            if item in bucket:
+                bucket.remove(item)
+                if not bucket:
+                    del self.indexes[name][key]
+        if self.watch:
+            item.removeIndex(self)
+        self.count -= 1
+
+    def lookup(self, name, key):
+        """
+        Returns list of all objects with given key in given index.
+        """
+        return self.indexes[name].get(key, [])
 
 
-def readQuakeML(*args, **kwargs):
+def _waveform_codes(obj):
+    """
+    Returns (network, station, location, SEED id) of the waveform_id of
+    given pick/amplitude/station magnitude.
     """
-    Patched readEvents function from obspy that creates instances of our
-    subclassed event classes instead of the original obspy classes.
+    wid = obj.waveform_id
+    if wid is None:
+        return (None, None, None, None)
+    return (wid.network_code, wid.station_code, wid.location_code,
+            wid.getSEEDString())
+
+
+def _resource_id_string(resource_id):
+    if resource_id is None:
+        return None
+    return str(resource_id)
+
+
+# keys of the pick index: (network, station, phase_hint),
+# (station, phase_hint), (SEED id, phase_hint) and resource_id
+PICK_INDEX_KEYS = {
+    'netsta': lambda p: _waveform_codes(p)[:2] + (p.phase_hint, ),
+    'sta': lambda p: (_waveform_codes(p)[1], p.phase_hint),
+    'seed': lambda p: (_waveform_codes(p)[3], p.phase_hint),
+    'resource_id': lambda p: _resource_id_string(p.resource_id)}
+# key of the arrival index: pick_id
+ARRIVAL_INDEX_KEYS = {
+    'pick_id': lambda a: _resource_id_string(a.pick_id)}
+# keys of the amplitude index: (network, station), (network, station,
+# location) and SEED id
+AMPLITUDE_INDEX_KEYS = {
+    'netsta': lambda a: _waveform_codes(a)[:2],
+    'netstaloc': lambda a: _waveform_codes(a)[:3],
+    'seed': lambda a: _waveform_codes(a)[3]}
+# keys of the station magnitude index: station and (network, station,
+# location)
+STATION_MAGNITUDE_INDEX_KEYS = {
+    'sta': lambda sm: _waveform_codes(sm)[1],
+    'netstaloc': lambda sm: _waveform_codes(sm)[:3]}
+
+
+
+# QuakeML elements that hold one item of a list: tag -> (container, class)
+QUAKEML_CONTAINERS = {
+    'pick': ('picks', Pick),
+    'amplitude': ('amplitudes', Amplitude),
+    'origin': ('origins', Origin),
+    'arrival': ('arrivals', Arrival),
+    'magnitude': ('magnitudes', Magnitude),
+    'stationMagnitude': ('station_magnitudes', StationMagnitude),
+    'stationMagnitudeContribution': ('station_magnitude_contributions',
+                                     StationMagnitudeContribution),
+    'focalMechanism': ('focal_mechanisms', FocalMechanism),
+    'comment': ('comments', Comment),
+    'description': ('event_descriptions', EventDescription),
+    'compositeTime': ('composite_times', CompositeTime),
+    'waveformID': ('waveform_id', WaveformStreamID)}
+# QuakeML elements whose property name does not follow from the element name
+# (see _property_name)
+QUAKEML_PROPERTY_NAMES = {'Mrr': 'm_rr', 'Mtt': 'm_tt', 'Mpp': 'm_pp',
+                          'Mrt': 'm_rt', 'Mrp': 'm_rp', 'Mtp': 'm_tp'}
+QUANTITY_ERRORS = {'uncertainty': 'uncertainty',
+                   'lowerUncertainty': 'lower_uncertainty',
+                   'upperUncertainty': 'upper_uncertainty',
+                   'confidenceLevel': 'confidence_level'}
+
+
+def _split_tag(tag):
     """
-    bkp = {}
-    # replace original event classes with subclasses
-    for classname in CLASSES_TO_PATCH:
-        bkp[classname] = obspy.core.event.__dict__[classname]
-        obspy.core.quakeml.__dict__[classname] = local[classname]
-    from obspy.core.quakeml import readQuakeML
-    ret = obspy.core.quakeml.readQuakeML(*args, **kwargs)
-    # reset original event classes
-    for classname, class_ in bkp.iteritems():
-        obspy.core.quakeml.__dict__[classname] = bkp[classname]
+    Returns (namespace, local name) of an lxml tag/attribute name.
+    """
+    if tag.startswith("{"):
+        return tuple(tag[1:].split("}", 1))
+    return None, tag
+
+
+def _child_elements(element):
+    # skip xml comments and processing instructions
+    return (child for child in element.iterchildren()
+            if isinstance(child.tag, basestring))
+
+
+def _new_event_object(cls, element):
+    """
+    Creates object for given QuakeML element, our event classes directly get
+    the resource_id of the element (instead of a newly generated one).
+    """
+    if issubclass(cls, CommonEventHelper):
+        return cls(resource_id=element.get("publicID"))
+    return cls()
+
+
+def _property_name(obj, name):
+    """
+    Returns the property of obj that holds given QuakeML element/attribute
+    (None if there is none), e.g. "phaseHint" -> "phase_hint", "type" of a
+    magnitude -> "magnitude_type", "nodalPlane1" -> "nodal_plane_1".
+    """
+    properties = getattr(obj.__class__, "_property_dict", {})
+    if QUAKEML_PROPERTY_NAMES.get(name) in properties:
+        return QUAKEML_PROPERTY_NAMES[name]
+    name = camelcase2lower(name)
+    for candidate in (name, re.sub(r'([a-z])(\d)', r'\1_\2', name),
+                      "%s_%s" % (camelcase2lower(obj.__class__.__name__),
+                                 name)):
+        if candidate in properties:
+            return candidate
+    return None
+
+
+def _convert(attrib_type, text):
+    # everything else is converted by obspy when the property is set
+    if attrib_type is bool:
+        return text.strip().lower() in ("true", "1")
+    return text.strip()
+
+
+def _read_extra(obj, element):
+    """
+    Stores custom namespace element in obj.extra the same way obspy's
+    QuakeML reader does (e.g. the weight of picks or the public flag of
+    events).
+    """
+    ns, name = _split_tag(element.tag)
+    if len(element):
+        sub = AttribDict()
+        for child in _child_elements(element):
+            _read_extra(sub, child)
+        value = sub.get("extra")
+    else:
+        value = element.text
+    extra = obj.setdefault("extra", AttribDict())
+    extra[name] = {'value': value, 'namespace': ns}
+    if element.attrib:
+        extra[name]['attrib'] = dict(element.attrib)
+
+
+def _warn_unknown(obj, name):
+    msg = "QuakeML reader: ignoring unknown element/attribute '%s' of %s." % (
+        name, obj.__class__.__name__)
+    warnings.warn(msg)
+
+
+def _read_child(obj, child):
+    """
+    Sets property/appends to container of obj from given child element.
+    """
+    ns, name = _split_tag(child.tag)
+    if ns not in QUAKEML_NAMESPACES:
+        _read_extra(obj, child)
+        return
+    if name in QUAKEML_CONTAINERS:
+        container, cls = QUAKEML_CONTAINERS[name]
+        if container in getattr(obj.__class__, "_containers", []):
+            item = _new_event_object(cls, child)
+            _read_element(item, child)
+            getattr(obj, container).append(item)
+            return
+    prop = _property_name(obj, name)
+    if prop is None:
+        _warn_unknown(obj, name)
+        return
+    attrib_type = obj._property_dict[prop]
+    value = child.find("{%s}value" % ns)
+    if value is not None:
+        # quantity with value and uncertainties
+        if value.text is None:
+            return
+        setattr(obj, prop, _convert(attrib_type, value.text))
+        if prop + "_errors" not in obj._property_dict:
+            return
+        errors = QuantityError()
+        for key, error_key in QUANTITY_ERRORS.iteritems():
+            error = child.find("{%s}%s" % (ns, key))
+            if error is not None:
+                errors[error_key] = float(error.text)
+        setattr(obj, prop + "_errors", errors)
+    elif isinstance(attrib_type, type) and \
+            issubclass(attrib_type, AttribDict):
+        item = _new_event_object(attrib_type, child)
+        _read_element(item, child)
+        setattr(obj, prop, item)
+    elif child.text is not None:
+        setattr(obj, prop, _convert(attrib_type, child.text))
+
+
+def _read_element(obj, element):
+    """
+    Sets properties, containers and extras of obj from given QuakeML
+    element.
+    """
+    resource_id = None
+    for key, value in element.attrib.iteritems():
+        ns, name = _split_tag(key)
+        if ns is not None:
+            extra = obj.setdefault("extra", AttribDict())
+            extra[name] = {'value': str(value), 'namespace': ns,
+                           'type': 'attribute'}
+        elif name in ("publicID", "id"):
+            resource_id = value
+        else:
+            prop = _property_name(obj, name)
+            if prop is None:
+                _warn_unknown(obj, name)
+                continue
+            setattr(obj, prop, _convert(obj._property_dict[prop], value))
+    # e.g. resource_uri of waveform ids
+    text = (element.text or "").strip()
+    if text and "resource_uri" in getattr(obj, "_property_dict", {}):
+        obj.resource_uri = text
+    for child in _child_elements(element):
+        _read_child(obj, child)
+    # set last, so that picks/amplitudes are not marked as changed (see
+    # CommonEventHelper.commitID)
+    if resource_id is not None:
+        obj.resource_id = resource_id
+
+
+def readQuakeML(source):
+    """
+    Reads QuakeML (filename or file-like object) into a catalog of our
+    subclassed event classes.
+
+    The document is parsed incrementally, every event is converted as soon
+    as it is complete and its elements are freed afterwards. Objects are
+    created with the resource_ids from the document, so no new ids are
+    generated while reading. Custom namespace elements/attributes (e.g. the
+    weight of picks or the public flag of events) end up in `extra` as with
+    obspy's QuakeML reader.
+    """
+    catalog = None
+    for action, element in etree.iterparse(source, events=("start", "end")):
+        ns, name = _split_tag(element.tag)
+        if name == "eventParameters" and ns in QUAKEML_NAMESPACES:
+            if action == "start":
+                catalog = Catalog(resource_id=element.get("publicID"))
+            continue
+        if action != "end" or catalog is None:
+            continue
+        parent = element.getparent()
+        if parent is None or _split_tag(parent.tag)[1] != "eventParameters":
+            continue
+        # the catalog is no event type class, so its children are handled
+        # explicitly
+        if ns in QUAKEML_NAMESPACES:
+            if name == "event":
+                event = _new_event_object(Event, element)
+                _read_element(event, element)
+                catalog.append(event)
+            elif name == "comment":
+                comment = Comment()
+                _read_element(comment, element)
+                catalog.comments.append(comment)
+            elif name == "creationInfo":
+                creation_info = CreationInfo()
+                _read_element(creation_info, element)
+                catalog.creation_info = creation_info
+            elif name == "description":
+                catalog.description = element.text
+        # free memory of processed elements
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
+    if catalog is None:
+        raise ValueError("Not a QuakeML document (no eventParameters).")
+    return catalog
+
+
+def commitResourceIDs(catalog):
+    """
+    Set new resource_ids for all picks and amplitudes in catalog that were
+    changed since they got their current one (see
+    :meth:`CommonEventHelper.commitID`).
+    """
+    for event in catalog:
+        for obj in event.picks:
+            obj.commitID()
+        for obj in event.amplitudes:
+            obj.commitID()
+
+
+def writeQuakeML(catalog, **kwargs):
+    """
+    Returns given catalog as QuakeML string. Keyword arguments are passed on
+    to :meth:`obspy.core.event.Catalog.write` (e.g. `nsmap`). The document is
+    written to an in-memory buffer, no temporary file is involved.
+    """
+    commitResourceIDs(catalog)
+    buf = BytesIO()
+    catalog.write(buf, "QUAKEML", **kwargs)
+    return buf.getvalue()
+
+
+def _differences(ours, theirs, path, ret):
+    """
+    Appends descriptions of differing values of (nested) event objects to
+    ret.
+    """
+    if isinstance(ours, AttribDict) and isinstance(theirs, AttribDict):
+        keys = getattr(ours.__class__, "_property_keys", None)
+        if keys is None:
+            keys = sorted(set(ours.keys()) | set(theirs.keys()))
+        else:
+            keys = keys + ours._containers + ["extra"]
+        for key in keys:
+            _differences(ours.get(key), theirs.get(key),
+                         "%s.%s" % (path, key), ret)
+    elif isinstance(ours, list) and isinstance(theirs, list):
+        if len(ours) != len(theirs):
+            ret.append("%s: %i != %i items" % (path, len(ours), len(theirs)))
+            return
+        for i, (ours_, theirs_) in enumerate(zip(ours, theirs)):
+            _differences(ours_, theirs_, "%s[%i]" % (path, i), ret)
+    elif ours != theirs:
+        ret.append("%s: %r != %r" % (path, ours, theirs))
+
+
+def compare_with_obspy(filename):
+    """
+    Reads a QuakeML file with :func:`readQuakeML` and with obspy's reader
+    (which :func:`readQuakeML` replaced) and compares the results, to make
+    sure nothing gets lost on a read/upload round-trip.
+
+    :returns: List of differences (empty if both catalogs are the same).
+    """
+    from obspy import readEvents
+    ours = readQuakeML(filename)
+    theirs = readEvents(filename, format="QUAKEML")
+    ret = []
+    for key in ("resource_id", "description", "comments", "creation_info",
+                "events"):
+        _differences(getattr(ours, key), getattr(theirs, key), key, ret)
     return ret
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage="%prog file [file ...]",
+        description="Check that QuakeML files are read the same way as by "
+        "obspy's reader.")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("No QuakeML files given.")
+    failed = False
+    for filename in args:
+        differences = compare_with_obspy(filename)
+        for difference in differences:
+            print "%s: %s" % (filename, difference)
+        if not differences:
+            print "%s: OK" % filename
+        failed = failed or bool(differences)
+    sys.exit(failed and 1 or 0)
+
+
+if __name__ == "__main__":
+    main()
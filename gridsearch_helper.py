@@ -0,0 +1,265 @@
+import math
+
+import numpy as np
+
+# km per degree latitude
+KM_PER_DEGREE = 111.195
+# layer top depth (km), P and S velocity (km/s) of the model used if no
+# velocity model file is given (simple continental crust over mantle)
+DEFAULT_MODEL = [(0.0, 5.8, 3.36), (20.0, 6.5, 3.75), (35.0, 8.04, 4.47)]
+# sources closer to the surface are moved down to this depth (km), the
+# direct ray needs some thickness to travel through
+MIN_DEPTH = 0.01
+# take-off angles (degrees, in the fastest layer) of the direct rays traced
+# to interpolate travel times, denser towards horizontal rays as distances
+# grow fast there
+DIRECT_ANGLES = 90.0 * (1.0 - np.linspace(1.0, 0.0, 300, endpoint=False) ** 2)
+# each refinement shrinks the grid around the best node by this factor
+SHRINK = 0.25
+
+
+def read_velocity_model(filename):
+    """
+    Reads a layered velocity model from a text file with one layer per line:
+    depth of the layer top (km), P velocity and S velocity (km/s). Empty
+    lines and lines starting with "#" are ignored.
+    """
+    layers = []
+    with open(filename, "rt") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            depth, vp, vs = [float(x) for x in line.split()[:3]]
+            layers.append((depth, vp, vs))
+    return layers
+
+
+class LayeredModel(object):
+    """
+    Horizontally layered velocity model with constant velocities in each
+    layer. Travel times of first arrivals (direct wave or head wave along
+    any of the layer boundaries) are computed for arrays of distances at
+    once.
+    """
+    def __init__(self, layers, name="default"):
+        """
+        :param layers: List of (layer top depth in km, P velocity, S
+            velocity in km/s), the first layer starting at the surface.
+        :param name: Model name (used as earth model id of origins).
+        """
+        layers = sorted(layers)
+        if not layers or layers[0][0] != 0:
+            msg = "First layer of velocity model has to start at 0 km."
+            raise ValueError(msg)
+        self.name = name
+        self.tops = np.array([layer[0] for layer in layers], dtype=np.float64)
+        self.velocities = {
+            'P': np.array([layer[1] for layer in layers], dtype=np.float64),
+            'S': np.array([layer[2] for layer in layers], dtype=np.float64)}
+
+    def travel_times(self, phase, distances, depth):
+        """
+        Returns travel times (s) and take-off angles (degrees from vertical
+        down, i.e. 0 is down and 180 is up) of the first arrival of a phase
+        from a source at given depth to receivers at the surface.
+
+        :param phase: "P" or "S".
+        :param distances: Array of epicentral distances (km).
+        :param depth: Source depth (km).
+        """
+        v = self.velocities[phase]
+        distances = np.asarray(distances, dtype=np.float64)
+        depth = max(depth, MIN_DEPTH)
+        # source layer and thicknesses of the layers above the source
+        j = np.searchsorted(self.tops, depth, side="right") - 1
+        thickness = np.diff(np.append(self.tops[:j + 1], depth))
+        times, takeoff = _direct(distances, thickness, v[:j + 1])
+        # head waves along the top of deeper, faster layers
+        full = np.diff(self.tops)
+        for k in xrange(j + 1, len(v)):
+            if v[k] <= v[:k].max():
+                continue
+            p = 1.0 / v[k]
+            # layers crossed going down from the source and going up to the
+            # surface
+            h = full[:k].copy()
+            h[j] += self.tops[j + 1] - depth
+            h[j + 1:] *= 2
+            cos = np.sqrt(1.0 - (p * v[:k]) ** 2)
+            intercept = (h * cos / v[:k]).sum()
+            critical = (h * p * v[:k] / cos).sum()
+            head = distances * p + intercept
+            use = (distances >= critical) & (head < times)
+            times = np.where(use, head, times)
+            takeoff = np.where(use, math.degrees(math.asin(p * v[j])),
+                               takeoff)
+        return times, takeoff
+
+
+def _direct(distances, thickness, v):
+    """
+    Travel times and take-off angles of the direct (upgoing) ray through
+    layers of given thicknesses and velocities (source in last layer).
+    """
+    p = np.sin(np.radians(DIRECT_ANGLES)) / v.max()
+    cos = np.sqrt(1.0 - (p[:, np.newaxis] * v) ** 2)
+    x = (thickness * p[:, np.newaxis] * v / cos).sum(axis=1)
+    t = (thickness / (v * cos)).sum(axis=1)
+    times = np.interp(distances, x, t)
+    ray_p = np.interp(distances, x, p)
+    # beyond the flattest ray traced, the ray is almost horizontal in the
+    # fastest layer
+    far = distances > x[-1]
+    times = np.where(far, t[-1] + (distances - x[-1]) * p[-1], times)
+    takeoff = 180.0 - np.degrees(np.arcsin(np.clip(ray_p * v[-1], 0, 1)))
+    return times, takeoff
+
+
+def _project(latitudes, longitudes, latitude0, longitude0):
+    """
+    Local flat projection (km east, km north) around given point.
+    """
+    x = (np.asarray(longitudes) - longitude0) * KM_PER_DEGREE * \
+        math.cos(math.radians(latitude0))
+    y = (np.asarray(latitudes) - latitude0) * KM_PER_DEGREE
+    return x, y
+
+
+def _misfit(model, xs, ys, z, sx, sy, corrections, phases, times, weights):
+    """
+    Weighted squared misfit and best origin time (relative to the
+    observation times) of all epicenters in `xs`/`ys` at depth `z` (km).
+    """
+    distances = np.hypot(xs[:, np.newaxis] - sx, ys[:, np.newaxis] - sy)
+    tt = np.empty_like(distances)
+    for phase in ("P", "S"):
+        mask = phases == phase
+        if mask.any():
+            tt[:, mask] = model.travel_times(phase, distances[:, mask], z)[0]
+    residuals = times - tt - corrections
+    # the origin time minimizing the misfit is the weighted mean residual
+    t0 = (residuals * weights).sum(axis=1) / weights.sum()
+    chi2 = (((residuals - t0[:, np.newaxis]) ** 2) * weights).sum(axis=1)
+    return chi2, t0
+
+
+def _spread(nodes, chi2, max_depth):
+    """
+    Standard deviations (x, y, z in km) of the location probability over
+    the given grid nodes and for each axis whether the probability is
+    negligible on the grid border along that axis, i.e. whether the grid
+    covers the probable locations (depth limits of the search do not count
+    as border).
+    """
+    pdf = np.exp(-0.5 * (chi2 - chi2.min()))
+    pdf /= pdf.sum()
+    mean = (nodes * pdf[:, np.newaxis]).sum(axis=0)
+    std = np.sqrt((((nodes - mean) ** 2) * pdf[:, np.newaxis]).sum(axis=0))
+    covered = np.ones(3, dtype=bool)
+    for i, (lower, upper) in enumerate([(None, None)] * 2 +
+                                       [(0.0, max_depth)]):
+        border = np.zeros(len(nodes), dtype=bool)
+        if nodes[:, i].min() != lower:
+            border |= nodes[:, i] == nodes[:, i].min()
+        if nodes[:, i].max() != upper:
+            border |= nodes[:, i] == nodes[:, i].max()
+        if border.any():
+            covered[i] = pdf[border].max() < 0.01 * pdf.max()
+    return std, covered
+
+
+def grid_search(model, latitudes, longitudes, elevations, phases, times,
+                errors, max_depth=40.0, nodes=21, levels=6):
+    """
+    Locates an event by evaluating the misfit of all hypocenters on a 3-D
+    grid at once. The grid is refined around the best hypocenter for a
+    number of levels (coarse to fine). The origin time is solved for
+    analytically at each node.
+
+    All arguments besides `model` are per observation (arrays of the same
+    length).
+
+    :type model: :class:`LayeredModel` or
+        :class:`traveltime_helper.TravelTimeTable`
+    :param elevations: Station elevations (m).
+    :param phases: "P" or "S".
+    :param times: Observed arrival times (s, relative to some reference
+        time).
+    :param errors: Pick uncertainties (s), observations are weighted with
+        the inverse squared error.
+    :param max_depth: Maximum source depth (km).
+    :param nodes: Nodes per axis of the grid.
+    :param levels: Number of grid refinements.
+    :returns: Dictionary with the best `latitude`, `longitude`, `depth`
+        (km), origin `time` (s, relative to the reference time), `rms`
+        (s), `errors` (standard deviations in x, y, z in km) and per
+        observation `residuals` (s), `distances` (km), `azimuths` and
+        `takeoff_angles` (degrees).
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    phases = np.asarray(phases)
+    times = np.asarray(times, dtype=np.float64)
+    weights = 1.0 / np.asarray(errors, dtype=np.float64) ** 2
+    latitude0 = latitudes.mean()
+    longitude0 = longitudes.mean()
+    sx, sy = _project(latitudes, longitudes, latitude0, longitude0)
+    # stations above the model surface: vertical leg in the top layer
+    corrections = np.empty(len(times))
+    for phase in ("P", "S"):
+        mask = phases == phase
+        corrections[mask] = np.asarray(elevations)[mask] / 1e3 / \
+            model.velocities[phase][0]
+
+    center = np.array([0.0, 0.0, max_depth / 2.0])
+    half = np.array([max(np.ptp(sx), np.ptp(sy), 20.0)] * 2 +
+                    [max_depth / 2.0])
+    spread = None
+    for level in xrange(levels):
+        xs = center[0] + np.linspace(-half[0], half[0], nodes)
+        ys = center[1] + np.linspace(-half[1], half[1], nodes)
+        zs = np.linspace(max(center[2] - half[2], 0.0),
+                         min(center[2] + half[2], max_depth), nodes)
+        xs, ys = [a.ravel() for a in np.meshgrid(xs, ys)]
+        chi2 = []
+        t0 = []
+        for z in zs:
+            chi2_, t0_ = _misfit(model, xs, ys, z, sx, sy, corrections,
+                                 phases, times, weights)
+            chi2.append(chi2_)
+            t0.append(t0_)
+        chi2 = np.concatenate(chi2)
+        t0 = np.concatenate(t0)
+        grid = np.column_stack((np.tile(xs, len(zs)), np.tile(ys, len(zs)),
+                                np.repeat(zs, len(xs))))
+        best = chi2.argmin()
+        # uncertainty along each axis from the finest grid still covering
+        # the probable hypocenters (coarsest grid if the location is poorly
+        # constrained)
+        std, covered = _spread(grid, chi2, max_depth)
+        if spread is None:
+            spread = std
+        spread = np.where(covered, std, spread)
+        center = grid[best]
+        time = t0[best]
+        half *= SHRINK
+
+    x, y, z = center
+    distances = np.hypot(sx - x, sy - y)
+    residuals = np.empty(len(times))
+    takeoff_angles = np.empty(len(times))
+    for phase in ("P", "S"):
+        mask = phases == phase
+        tt, takeoff = model.travel_times(phase, distances[mask], z)
+        residuals[mask] = times[mask] - time - tt - corrections[mask]
+        takeoff_angles[mask] = takeoff
+    azimuths = np.degrees(np.arctan2(sx - x, sy - y)) % 360.0
+    latitude = latitude0 + y / KM_PER_DEGREE
+    longitude = longitude0 + x / (KM_PER_DEGREE *
+                                  math.cos(math.radians(latitude0)))
+    return {'latitude': latitude, 'longitude': longitude, 'depth': z,
+            'time': time, 'rms': np.sqrt((residuals ** 2).mean()),
+            'errors': spread, 'residuals': residuals,
+            'distances': distances, 'azimuths': azimuths,
+            'takeoff_angles': takeoff_angles}
@@ -0,0 +1,313 @@
+import math
+import threading
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from obspy import UTCDateTime
+
+from gridsearch_helper import KM_PER_DEGREE
+from nlloc_helper import read_nlloc_hyp
+from util import remove_workspace, terminate_program
+
+
+class LocatorJob(object):
+    """
+    Runs an external program call (see `PROGRAMS[...]['Call']` in
+    :func:`util.setup_external_programs`) in a background thread, so that
+    the GUI stays responsive while e.g. NLLoc does its grid search.
+
+    Lines written to stdout by the program are collected as they come in
+    and can be fetched periodically from the GUI thread with
+    :meth:`pop_output`. Input files have to be written before and output
+    files parsed after the job in the GUI thread, the job itself never
+    touches event data.
+    """
+    def __init__(self, name, call, *args):
+        """
+        :param name: Program name used in messages.
+        :param call: Program call, gets called with `args` and keyword
+            arguments `stdout_callback` and `started_callback` (see
+            :func:`util.run_program`).
+        """
+        self.name = name
+        self.call = call
+        self.args = args
+        # working directory (see util.create_workspace) the program runs in
+        self.workspace = None
+        self.lock = threading.Lock()
+        self.lines = []
+        self.process = None
+        self.cancelled = False
+        # (stdout, stderr, returncode) when the program finished
+        self.result = None
+        # exception message if running the program failed
+        self.exception = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        """
+        Runs the program call in the current thread (:meth:`start` runs it
+        in a new background thread).
+        """
+        if self.cancelled:
+            return
+        try:
+            result = self.call(*self.args, stdout_callback=self._output,
+                               started_callback=self._started)
+        except Exception as e:
+            with self.lock:
+                self.exception = "%s: %s" % (e.__class__.__name__, str(e))
+            return
+        with self.lock:
+            self.result = result
+
+    def _started(self, process):
+        with self.lock:
+            self.process = process
+            cancelled = self.cancelled
+        # cancelled before the program was even started
+        if cancelled:
+            terminate_program(process)
+
+    def _output(self, line):
+        with self.lock:
+            self.lines.append(line)
+
+    def pop_output(self):
+        """
+        Returns and forgets the lines the program wrote to stdout since the
+        last call.
+        """
+        with self.lock:
+            lines = self.lines
+            self.lines = []
+        return lines
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def cancel(self):
+        """
+        Terminates the program. The job finishes shortly afterwards with
+        :attr:`cancelled` set.
+        """
+        with self.lock:
+            self.cancelled = True
+            process = self.process
+        if process is not None:
+            terminate_program(process)
+
+    def cleanup(self):
+        """
+        Removes the working directory of the job (if any).
+        """
+        if self.workspace is not None:
+            remove_workspace(self.workspace)
+            self.workspace = None
+
+
+class LocatorJobGroup(object):
+    """
+    Runs several :class:`LocatorJob`s (e.g. NLLoc with different velocity
+    models) at the same time and looks like a single job to the GUI. Every
+    program call is a separate process, so up to `processes` of them run in
+    parallel.
+    """
+    def __init__(self, name, jobs, processes=None, output=True,
+                 keep_workspaces=False):
+        """
+        :param processes: Maximum number of programs running at the same
+            time, defaults to the number of CPUs.
+        :param output: Whether to pass on stdout of the programs (see
+            :meth:`pop_output`).
+        :param keep_workspaces: Whether :meth:`cleanup` should leave the
+            working directories of the jobs alone.
+        """
+        self.name = name
+        self.jobs = jobs
+        self.processes = processes or cpu_count()
+        self.output = output
+        self.keep_workspaces = keep_workspaces
+        self.workspace = None
+        self.exception = None
+        self.cancelled = False
+        self.pending = []
+
+    def start(self):
+        pool = ThreadPool(min(self.processes, len(self.jobs)) or 1)
+        self.pending = [pool.apply_async(job.run) for job in self.jobs]
+        # no more tasks, worker threads exit when all jobs are done
+        pool.close()
+
+    def is_running(self):
+        return not all(result.ready() for result in self.pending)
+
+    def pop_output(self):
+        """
+        Returns and forgets output lines of all jobs, prefixed with the job
+        names.
+        """
+        lines = []
+        for job in self.jobs:
+            lines.extend("%s: %s" % (job.name, line)
+                         for line in job.pop_output())
+        if not self.output:
+            return []
+        return lines
+
+    def cancel(self):
+        self.cancelled = True
+        for job in self.jobs:
+            job.cancel()
+
+    def cleanup(self):
+        if self.keep_workspaces:
+            return
+        for job in self.jobs:
+            job.cleanup()
+
+    @property
+    def result(self):
+        """
+        Combined stderr of all jobs (per job results are in the jobs).
+        """
+        err = "".join(job.result[1] for job in self.jobs
+                      if job.result is not None)
+        return ("", err, 0)
+
+
+def read_nlloc_summary(filename):
+    """
+    Reads the main values of the maximum likelihood hypocenter from a NLLoc
+    summary (.hyp) file, e.g. to compare several locations.
+
+    :returns: dictionary with keys `x`, `y` (NLLoc coordinates, see
+        :func:`util.latlongconv`), `depth` (km, positive down), `time`,
+        `rms`, `gap` and `ellipsoid` (see
+        :class:`nlloc_helper.NLLocEvent`) or None if the file holds no
+        location.
+    """
+    # only the hypocenter is needed, don't let a broken signature or phase
+    # line hide it
+    events = read_nlloc_hyp(filename, strict=False)
+    if not events or not events[0].has_hypocenter():
+        return None
+    event = events[0]
+    return {'x': event.x, 'y': event.y, 'depth': event.depth,
+            'time': event.time, 'rms': event.rms, 'gap': event.gap,
+            'ellipsoid': event.ellipsoid}
+
+
+def parse_hyp2000_origin(line):
+    """
+    Parses the origin line (the one following the " YEAR MO DA  --ORIGIN--"
+    header) of a hyp2000 summary (hypo.prt) file.
+
+    :returns: dictionary with keys `time`, `latitude`, `longitude`, `depth`
+        (km, positive down), `rms`, `horizontal_error` and `depth_error`
+        (km)
+    :raises: ValueError or IndexError if the line is malformed.
+    """
+    time = UTCDateTime(int(line[1:5]), int(line[6:8]), int(line[9:11]),
+                       int(line[13:15]), int(line[15:17]), float(line[18:23]))
+    lat = int(line[25:27]) + float(line[28:33]) / 60.
+    if line[27] == "S":
+        lat = -lat
+    lon = int(line[35:38]) + float(line[39:44]) / 60.
+    if line[38] == " ":
+        lon = -lon
+    return {'time': time, 'latitude': lat, 'longitude': lon,
+            'depth': float(line[46:51]), 'rms': float(line[52:57]),
+            'horizontal_error': float(line[58:63]),
+            'depth_error': float(line[64:69])}
+
+
+def read_hyp2000_summary(filename):
+    """
+    Reads the main values of the location from a hyp2000 summary
+    (hypo.prt) file, e.g. to compare several locations.
+
+    :returns: dictionary as returned by :func:`parse_hyp2000_origin` or None
+        if the file holds no location.
+    """
+    with open(filename, "rt") as fh:
+        lines = fh.readlines()
+    for i, line in enumerate(lines[:-1]):
+        if line.startswith(" YEAR MO DA  --ORIGIN--"):
+            break
+    else:
+        return None
+    try:
+        return parse_hyp2000_origin(lines[i + 1])
+    except (ValueError, IndexError):
+        return None
+
+
+def _offsets(reference, locations):
+    """
+    Returns array of (x, y, z) offsets in km (east, north, down) and time
+    offsets in s of locations relative to reference location.
+    """
+    cos_lat = math.cos(math.radians(reference['latitude']))
+    return np.array([
+        ((loc['longitude'] - reference['longitude']) * KM_PER_DEGREE *
+         cos_lat,
+         (loc['latitude'] - reference['latitude']) * KM_PER_DEGREE,
+         loc['depth'] - reference['depth'],
+         loc['time'] - reference['time'])
+        for loc in locations], dtype=np.float64).reshape((-1, 4))
+
+
+def resampling_statistics(reference, jackknife, subsets, stations, deleted):
+    """
+    Estimates location uncertainty from relocations with resampled station
+    sets.
+
+    Locations are dictionaries with keys `time`, `latitude`, `longitude`
+    and `depth` (km, positive down). Offsets are computed in a local flat
+    approximation, which is fine for the small differences involved.
+
+    :param reference: Location using all stations.
+    :param jackknife: List of (station, location) with the location using
+        all stations but the given one.
+    :param subsets: List of locations using random subsets of stations,
+        each leaving out `deleted` of all `stations` stations (delete-d
+        jackknife on randomly drawn subsets).
+    :returns: dictionary with the standard errors (x, y, z in km and time
+        in s) of the (delete-1) `jackknife` and of the delete-d jackknife
+        (`subsets`) locations (None if not enough locations), the
+        hypocenter `shifts` of leaving out single stations as list of
+        (station, km) sorted by decreasing shift and the `outliers` among
+        them, i.e. stations with a shift far above the median shift.
+    """
+    ret = {'jackknife': None, 'subsets': None, 'shifts': [],
+           'outliers': []}
+    if len(jackknife) > 1:
+        offsets = _offsets(reference, [loc for sta, loc in jackknife])
+        n = len(offsets)
+        deviations = offsets - offsets.mean(axis=0)
+        ret['jackknife'] = np.sqrt((n - 1.0) / n *
+                                   (deviations ** 2).sum(axis=0))
+        shifts = np.sqrt((offsets[:, :3] ** 2).sum(axis=1))
+        ret['shifts'] = sorted(zip([sta for sta, loc in jackknife], shifts),
+                               key=lambda item: item[1], reverse=True)
+        if n >= 3:
+            median = np.median(shifts)
+            mad = 1.4826 * np.median(np.abs(shifts - median))
+            threshold = median + 3 * max(mad, 0.1 * median)
+            ret['outliers'] = [sta for sta, shift in ret['shifts']
+                               if shift > threshold]
+    if len(subsets) > 1:
+        offsets = _offsets(reference, subsets)
+        deviations = offsets - offsets.mean(axis=0)
+        # delete-d jackknife variance (n - d) / (d * N) * sum of squared
+        # deviations for N subsets of n - d of n stations
+        ret['subsets'] = np.sqrt(
+            float(stations - deleted) / (deleted * len(offsets)) *
+            (deviations ** 2).sum(axis=0))
+    return ret
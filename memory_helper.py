@@ -0,0 +1,177 @@
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from util import stream_view
+
+
+class MemoryManager(object):
+    """
+    Keeps the waveform data held in memory below a given budget by moving
+    the raw data of the least recently viewed stations to a memory-mapped
+    spill file on local disk.
+
+    Stations are addressed by their index in the stream lists. `streams_bkp`
+    holds the raw data, `streams` the (possibly processed) displayed data
+    which shares the raw sample arrays unless processing is switched on
+    (see :func:`util.stream_view`). Evicted stations keep working as before,
+    their sample arrays are just backed by the spill file and are paged in
+    by the operating system when they are accessed. When a station is
+    viewed again (see :meth:`touch`) its data is loaded back into memory.
+    """
+    def __init__(self, streams_bkp, streams, max_bytes=None, dir=None):
+        """
+        :type max_bytes: int
+        :param max_bytes: Memory budget for waveform data in bytes. If None
+            or zero nothing is ever evicted.
+        :param dir: Directory for the spill file, see
+            :func:`tempfile.mkstemp`.
+        """
+        self.streams_bkp = streams_bkp
+        self.streams = streams
+        self.max_bytes = max_bytes
+        self.dir = dir
+        self.spill_filename = None
+        # station indices in order of last use, least recent first
+        self.lru = OrderedDict((i, None) for i in range(len(streams_bkp)))
+        self.current = None
+        # station indices currently backed by the spill file
+        self.evicted = set()
+        # (station index, trace index) -> list of (offset, dtype, shape) of
+        # data (and mask) in the spill file. raw data never changes, so
+        # every trace is written only once
+        self.spilled = {}
+
+    def nbytes(self, i):
+        """
+        Returns number of bytes of sample data held in memory for station
+        with given index, i.e. raw data that is not evicted plus processed
+        copies of the displayed data.
+        """
+        nbytes = 0
+        if i not in self.evicted:
+            for tr in self.streams_bkp[i]:
+                nbytes += _nbytes(tr.data)
+        for tr in self.streams[i]:
+            # shared raw data is flagged read-only, processed data is not
+            if tr.data.flags.writeable:
+                nbytes += _nbytes(tr.data)
+        return nbytes
+
+    def total_bytes(self):
+        return sum(self.nbytes(i) for i in range(len(self.streams_bkp)))
+
+    def touch(self, i):
+        """
+        Marks station with given index as the one currently viewed, loads
+        its data back into memory if it was evicted and evicts other
+        stations if the memory budget is exceeded.
+
+        :returns: list of indices of evicted stations
+        """
+        self.current = i
+        self.lru.pop(i, None)
+        self.lru[i] = None
+        if i in self.evicted:
+            self._reload(i)
+        return self.enforce()
+
+    def enforce(self):
+        """
+        Evicts least recently viewed stations (never the current one) until
+        the memory budget is met.
+
+        :returns: list of indices of evicted stations
+        """
+        evicted = []
+        if not self.max_bytes:
+            return evicted
+        total = self.total_bytes()
+        for i in list(self.lru.keys()):
+            if total <= self.max_bytes:
+                break
+            if i == self.current or i in self.evicted:
+                continue
+            nbytes = self.nbytes(i)
+            if not nbytes:
+                continue
+            self._evict(i)
+            total -= nbytes - self.nbytes(i)
+            evicted.append(i)
+        return evicted
+
+    def _evict(self, i):
+        for j, tr in enumerate(self.streams_bkp[i]):
+            tr.data = self._spill((i, j), tr.data)
+        # displayed data: drop processed copies, share the mapped data
+        self.streams[i] = stream_view(self.streams_bkp[i])
+        self.evicted.add(i)
+
+    def _reload(self, i):
+        for tr in self.streams_bkp[i]:
+            if np.ma.isMaskedArray(tr.data):
+                tr.data = np.ma.masked_array(np.array(tr.data.data),
+                                             mask=np.array(tr.data.mask))
+            else:
+                tr.data = np.array(tr.data)
+        self.streams[i] = stream_view(self.streams_bkp[i])
+        self.evicted.discard(i)
+
+    def _spill(self, key, data):
+        """
+        Writes data to the spill file (if not done before) and returns it
+        as a read-only memory-mapped array.
+        """
+        # empty files/regions can not be mapped
+        if not data.size:
+            return data
+        if key not in self.spilled:
+            if self.spill_filename is None:
+                fd, self.spill_filename = tempfile.mkstemp(
+                    prefix="obspyck-spill-", dir=self.dir)
+                os.close(fd)
+            arrays = [np.ma.getdata(data)]
+            if np.ma.isMaskedArray(data):
+                arrays.append(np.ma.getmaskarray(data))
+            info = []
+            with open(self.spill_filename, "r+b") as fh:
+                fh.seek(0, os.SEEK_END)
+                for array in arrays:
+                    array = np.ascontiguousarray(array)
+                    info.append((fh.tell(), array.dtype, array.shape))
+                    array.tofile(fh)
+            self.spilled[key] = info
+        mapped = [np.memmap(self.spill_filename, dtype=dtype, mode="r",
+                            offset=offset, shape=shape)
+                  for offset, dtype, shape in self.spilled[key]]
+        if len(mapped) == 2:
+            return np.ma.masked_array(mapped[0], mask=mapped[1])
+        return mapped[0]
+
+    def close(self):
+        """
+        Removes the spill file.
+        """
+        if self.spill_filename is not None:
+            try:
+                os.remove(self.spill_filename)
+            except OSError:
+                pass
+            self.spill_filename = None
+        self.spilled = {}
+
+
+def _nbytes(data):
+    # file-backed data (spilled or from the waveform store) is paged in and
+    # out by the operating system
+    # (copies of memory-mapped arrays are still np.memmap instances, but
+    # writeable and not backed by a file)
+    mapped = np.ma.getdata(data)
+    if isinstance(mapped, np.memmap) and not mapped.flags.writeable:
+        return 0
+    nbytes = np.ma.getdata(data).nbytes
+    if np.ma.isMaskedArray(data) and data.mask is not np.ma.nomask:
+        nbytes += data.mask.nbytes
+    return nbytes
@@ -0,0 +1,229 @@
+from collections import namedtuple
+
+from obspy import UTCDateTime
+
+NLLocSignature = namedtuple("NLLocSignature",
+                            ["text", "version", "creation_time"])
+NLLocPhase = namedtuple("NLLocPhase", [
+    "station", "instrument", "component", "onset", "phase", "first_motion",
+    "time", "error_type", "error", "predicted_travel_time", "residual",
+    "weight", "station_x", "station_y", "station_z", "distance",
+    "station_azimuth", "ray_azimuth", "ray_dip", "ray_quality"])
+
+
+class NLLocEvent(object):
+    """
+    Location of one event in a NLLoc hypocenter-phase (.hyp) file.
+
+    :ivar signature: :class:`NLLocSignature`
+    :ivar x: x coordinate of the maximum likelihood hypocenter (NLLoc
+        coordinates, see :func:`util.latlongconv`).
+    :ivar y: y coordinate of the maximum likelihood hypocenter.
+    :ivar depth: Depth of the maximum likelihood hypocenter (km, positive
+        down).
+    :ivar time: Origin time.
+    :ivar rms: RMS of the residuals (s).
+    :ivar gap: Azimuthal gap (degrees).
+    :ivar ellipsoid: Error ellipsoid (68% confidence) as azimuth/dip/length
+        of axis 1 and 2 and length of axis 3, see
+        :func:`util.errorEllipsoid2CartesianErrors`.
+    :ivar phases: List of :class:`NLLocPhase`.
+    """
+    def __init__(self):
+        self.signature = None
+        self.x = None
+        self.y = None
+        self.depth = None
+        self.time = None
+        self.rms = None
+        self.gap = None
+        self.ellipsoid = None
+        self.phases = []
+
+    def has_hypocenter(self):
+        """
+        Whether hypocenter, origin time, quality and error ellipsoid were
+        found (not checking signature and phases).
+        """
+        return None not in (self.x, self.y, self.depth, self.time, self.rms,
+                            self.gap, self.ellipsoid)
+
+    def is_complete(self):
+        """
+        Whether all hypocenter information was found (not checking phases).
+        """
+        return self.signature is not None and self.has_hypocenter()
+
+
+def _parse_signature(line):
+    text = line.rstrip().split('"')[1]
+    signature, version, date, time = text.rsplit(" ", 3)
+    creation_time = UTCDateTime().strptime(date + time, str("%d%b%Y%Hh%Mm%S"))
+    return NLLocSignature(signature.strip(), version, creation_time)
+
+
+def _parse_phase(fields):
+    """
+    Parses a phase line of a NLLoc hypocenter-phase file (split in fields).
+
+    Order of fields:
+    ID Ins Cmp On Pha FM Date HrMn Sec Err ErrMag Coda Amp Per [PriorWt] >
+    TTpred Res Weight StaLoc(X Y Z) SDist SAzim RAz RDip RQual Tcorr ...
+
+    Fields:
+    ID (char*6)
+        station name or code
+    Ins (char*4)
+        instrument identification for the trace for which the time pick
+        corresponds (i.e. SP, BRB, VBB)
+    Cmp (char*4)
+        component identification for the trace for which the time pick
+        corresponds (i.e. Z, N, E, H)
+    On (char*1)
+        description of P phase arrival onset; i, e
+    Pha (char*6)
+        Phase identification (i.e. P, S, PmP)
+    FM (char*1)
+        first motion direction of P arrival; c, C, u, U = compression; d, D
+        = dilatation; +, -, Z, N; . or ? = not readable.
+    Date (yyyymmdd) (int*6)
+        year (with century), month, day
+    HrMn (hhmm) (int*4)
+        Hour, min
+    Sec (float*7.4)
+        seconds of phase arrival
+    Err (char*3)
+        Error/uncertainty type; GAU
+    ErrMag (expFloat*9.2)
+        Error/uncertainty magnitude in seconds
+    > (char*1)
+        Required separator between first part (observations) and second part
+        (calculated values) of phase record.
+    TTpred (float*9.4)
+        Predicted travel time
+    Res (float*9.4)
+        Residual (observed - predicted arrival time)
+    Weight (float*9.4)
+        Phase weight (covariance matrix weight for LOCMETH GAU_ANALYTIC,
+        posterior weight for LOCMETH EDT EDT_OT_WT)
+    StaLoc(X Y Z) (3 * float*9.4)
+        Non-GLOBAL: x, y, z location of station in transformed, rectangular
+        coordinates
+        GLOBAL: longitude, latitude, z location of station
+    SDist (float*9.4)
+        Maximum likelihood hypocenter to station epicentral distance in
+        kilometers
+    SAzim (float*6.2)
+        Maximum likelihood hypocenter to station epicentral azimuth in
+        degrees CW from North
+    RAz (float*5.1)
+        Ray take-off azimuth at maximum likelihood hypocenter in degrees CW
+        from North
+    RDip (float*5.1)
+        Ray take-off dip at maximum likelihood hypocenter in degrees upwards
+        from vertical down (0 = down, 180 = up)
+    RQual (float*5.1)
+        Quality of take-off angle estimation (0 = unreliable, 10 = best)
+
+    The calculated values are located relative to the ">" separator, as
+    newer NLLoc versions insert additional observation fields before it.
+    """
+    i = fields.index(">")
+    date = fields[6]
+    hour_min = fields[7]
+    time = UTCDateTime(int(date[:4]), int(date[4:6]), int(date[6:8]),
+                       int(hour_min[:2]), int(hour_min[2:4])) + \
+        float(fields[8])
+    calc = [float(x) for x in fields[i + 1:i + 12]]
+    return NLLocPhase(fields[0], fields[1], fields[2], fields[3], fields[4],
+                      fields[5], time, fields[9], float(fields[10]), *calc)
+
+
+def _parse_line(event, key, line, fields):
+    """
+    Sets the values of given line (split in fields) of a NLLoc
+    hypocenter-phase file outside of the phase block on given event.
+    """
+    if key == "SIGNATURE":
+        event.signature = _parse_signature(line)
+    elif key == "HYPOCENTER":
+        event.x = float(fields[2])
+        event.y = float(fields[4])
+        event.depth = float(fields[6])
+    elif key == "GEOGRAPHIC" and fields[1] == "OT":
+        event.time = UTCDateTime(
+            int(fields[2]), int(fields[3]), int(fields[4]),
+            int(fields[5]), int(fields[6]), float(fields[7]))
+    elif key == "QUALITY":
+        event.rms = float(fields[8])
+        event.gap = float(fields[12])
+    elif key == "STATISTICS":
+        event.ellipsoid = [float(fields[i])
+                           for i in (20, 22, 24, 26, 28, 30, 32)]
+
+
+def read_nlloc_hyp(filename, strict=True):
+    """
+    Reads all event locations from a NLLoc hypocenter-phase (.hyp) file in
+    a single pass, e.g. the summary of a single location or the cumulative
+    file of a batch location run.
+
+    :param strict: If False, lines that can not be parsed are skipped
+        instead of raising (the corresponding values stay None), e.g. to
+        only compare hypocenters.
+    :returns: list of :class:`NLLocEvent`
+    """
+    events = []
+    event = None
+    in_phases = False
+    with open(filename, "rt") as fh:
+        for line in fh:
+            fields = line.split()
+            if not fields:
+                continue
+            key = fields[0]
+            if in_phases:
+                if key == "END_PHASE":
+                    in_phases = False
+                    continue
+                try:
+                    event.phases.append(_parse_phase(fields))
+                except (ValueError, IndexError, TypeError):
+                    if strict:
+                        raise
+                continue
+            if key == "NLLOC":
+                event = NLLocEvent()
+                events.append(event)
+                continue
+            if key == "END_NLLOC":
+                event = None
+                continue
+            if key not in ("SIGNATURE", "HYPOCENTER", "GEOGRAPHIC",
+                           "QUALITY", "STATISTICS", "PHASE"):
+                continue
+            # be lenient with files lacking the NLLOC header line
+            if event is None:
+                event = NLLocEvent()
+                events.append(event)
+            try:
+                _parse_line(event, key, line, fields)
+            except (ValueError, IndexError, TypeError):
+                if strict:
+                    raise
+            if key == "PHASE":
+                in_phases = True
+    return events
+
+
+def read_nlloc_control_model(filename):
+    """
+    Returns the name of the velocity model (base name of the travel time
+    grids in the last LOCFILES statement) of a NLLoc control file or None.
+    """
+    model = None
+    with open(filename, "rt") as fh:
+        for line in fh:
+            if line.startswith("LOCFILES"):
+                model = line.split()[3].split("/")[-1]
+    return model
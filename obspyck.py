@@ -12,6 +12,7 @@
 
 import os
 import sys
+import math
 import shutil
 import optparse
 import warnings
@@ -37,7 +38,7 @@ from lxml.etree import SubElement as Sub
 #sys.path.append('/baysoft/obspy/misc/symlink')
 #os.chdir("/baysoft/obspyck/")
 from obspy import __version__ as OBSPY_VERSION
-from obspy.core.util import NamedTemporaryFile, AttribDict
+from obspy.core.util import AttribDict
 from obspy.core.util.geodetics import gps2DistAzimuth, kilometer2degrees
 from obspy import UTCDateTime, Stream#, readEvents
 from obspy.signal.util import utlLonLat, utlGeoKm
@@ -45,14 +46,27 @@ from obspy.signal.invsim import estimateMagnitude, paz2AmpValueOfFreqResp
 from obspy.signal import rotate_ZNE_LQT, rotate_NE_RT
 from obspy.signal import arPick
 from obspy.signal.util import az2baz2az
-from obspy.imaging.spectrogram import spectrogram
 from obspy.imaging.beachball import Beachball
 
 from qt_designer import Ui_qMainWindow_obsPyck
 from util import *
+from spectrogram_helper import SpectrogramCache, plot_spectrogram, FAILED
+from memory_helper import MemoryManager
+from locator_helper import LocatorJob, LocatorJobGroup, read_nlloc_summary, \
+    read_hyp2000_summary, parse_hyp2000_origin, resampling_statistics
+from nlloc_helper import read_nlloc_hyp, read_nlloc_control_model
+from gridsearch_helper import LayeredModel, DEFAULT_MODEL, \
+    read_velocity_model, grid_search
+from traveltime_helper import get_travel_time_table
+from waveform_store import save_streams, load_streams
+from session_helper import SESSION_WIDGETS, get_widget_state, \
+    set_widget_state, streams_to_arrays, arrays_to_streams, save_session, \
+    load_session
 from event_helper import Catalog, Event, Origin, Pick, Arrival, \
     Magnitude, StationMagnitude, StationMagnitudeContribution, \
-    FocalMechanism, ResourceIdentifier, ID_ROOT, readQuakeML, Amplitude
+    FocalMechanism, ResourceIdentifier, ID_ROOT, readQuakeML, Amplitude, \
+    writeQuakeML, commitResourceIDs, ListIndex, PICK_INDEX_KEYS, \
+    AMPLITUDE_INDEX_KEYS, STATION_MAGNITUDE_INDEX_KEYS, ARRIVAL_INDEX_KEYS
 from obspy.core.event import CreationInfo, WaveformStreamID, \
     OriginUncertainty, OriginQuality, Comment, NodalPlane, NodalPlanes
 
@@ -64,9 +78,15 @@ class ObsPyck(QtGui.QMainWindow):
     """
     Main Window with the design loaded from the Qt Designer.
     """
-    def __init__(self, clients, streams, options, keys):
+    def __init__(self, clients, streams, options, keys, cleaned=False,
+                 session=None):
         """
         Standard init.
+
+        :param cleaned: Whether streams were already merged, checked and
+            cleaned up (i.e. loaded from the waveform store or a session).
+        :param session: Session dictionary to restore event data and view
+            settings from, see :meth:`getSession`.
         """
         self.clients = clients
         self.streams = streams
@@ -168,26 +188,26 @@ class ObsPyck(QtGui.QMainWindow):
                   "(e.g. 'send Event')."
             self.error(msg)
 
-        # fetch event data via fdsn, arrivals from taup
-        if self.options.noevents:
-            fdsn_events, taup_arrivals, msg = None, None, None
-        else:
-            fdsn_events, taup_arrivals, msg = \
-                get_event_info(self.T0, self.T1, self.streams)
-            if fdsn_events is None:
-                print >> sys.stderr, "Could not determine possible arrivals using obspy.fdsn/taup."
-            if msg:
-                self.error(msg)
-        self.taup_arrivals = taup_arrivals
-        if fdsn_events is None:
-            self.taup_arrivals = []
-        else:
-            print "%i event(s) with possible arrivals found using obspy.fdsn/taup:" % len(fdsn_events)
-            for ev in fdsn_events:
-                o = ev.origins[0]
-                m = ev.magnitudes[0]
-                print " ".join([str(o.time), str(m.magnitude_type),
-                                str(m.mag), str(o.region)])
+        # fetch event data via fdsn, arrivals from taup. this runs in the
+        # background, a timer shows the arrivals when they are determined
+        # (see _checkEventInfo())
+        self.taup_arrivals = {}
+        self.eventInfoLookup = None
+        self.eventInfoTimer = QtCore.QTimer(self)
+        self.eventInfoTimer.setInterval(200)
+        self.connect(self.eventInfoTimer, QtCore.SIGNAL("timeout()"),
+                     self._checkEventInfo)
+        # restored sessions bring their theoretical arrivals along and
+        # never fetch anything over the network
+        if not self.options.noevents and session is None:
+            cache_dir = self.options.cache_dir
+            if cache_dir:
+                cache_dir = os.path.expanduser(cache_dir)
+            self.eventInfoLookup = EventInfoLookup(
+                self.T0, self.T1, self.streams, cache_dir,
+                self.options.event_source)
+            self.eventInfoLookup.start()
+            self.eventInfoTimer.start()
 
         self.fig = self.widgets.qMplCanvas.fig
         facecolor = self.qMain.palette().color(QtGui.QPalette.Window).getRgb()
@@ -197,20 +217,63 @@ class ObsPyck(QtGui.QMainWindow):
         #this next flag indicates if we zoom on time or amplitude axis
         self.flagWheelZoomAmplitude = False
         check_keybinding_conflicts(KEYS)
+        self.tmp_dir = None
         try:
             self.tmp_dir = setup_external_programs(options)
         except IOError:
             msg = "Cannot find external programs dir, localization " + \
                   "methods/functions are deactivated"
             warnings.warn(msg)
+        # incremented on every change of the event data, QuakeML output is
+        # cached until the next change (see get_QUAKEML_string())
+        self.catalogModifications = 0
+        self.quakemlCache = (None, None)
         self.catalog = Catalog()
         event = Event()
         event.set_creation_info(self.username)
         self.catalog.events = [event]
         self.setXMLEventID()
+        # hash indexes on picks, amplitudes and station magnitudes of the
+        # event, see getEventIndex()
+        self.eventIndexes = {
+            # picks get a new resource_id on every change
+            'picks': ListIndex(PICK_INDEX_KEYS, watch=True),
+            'amplitudes': ListIndex(AMPLITUDE_INDEX_KEYS),
+            'station_magnitudes': ListIndex(STATION_MAGNITUDE_INDEX_KEYS)}
+        # index on arrivals of the current origin by pick_id, see
+        # getArrivalForPick()/getPickForArrival()
+        self.arrivalIndex = ListIndex(ARRIVAL_INDEX_KEYS)
         # indicates which of the available focal mechanisms is selected
         self.focMechCurrent = None 
         self.spectrogramColormap = matplotlib.cm.jet
+        # spectrograms are computed in the background, in the meantime the
+        # seismograms are shown. a timer checks for finished computations.
+        self.spectrogramCache = SpectrogramCache()
+        self.spectrogramTimer = QtCore.QTimer(self)
+        self.spectrogramTimer.setInterval(200)
+        self.connect(self.spectrogramTimer, QtCore.SIGNAL("timeout()"),
+                     self._checkSpectrograms)
+        # external locator programs run in the background (see
+        # startLocatorJob()), a timer shows their output and processes the
+        # results when they are finished.
+        self.locatorJob = None
+        self.locatorFinish = None
+        # event and picks when the job started, see getLocatorSnapshot()
+        self.locatorSnapshot = None
+        # NLLoc runs with all velocity models: list of (model, workspace,
+        # summary), see on_qToolButton_compareNlloc_clicked()
+        self.nllocComparison = []
+        # event and picks the comparison was run with, see
+        # getLocatorSnapshot()
+        self.nllocComparisonSnapshot = None
+        self.nllocComparisonDialog = None
+        # travel time table of the velocity model of the built-in grid
+        # search, see getVelocityModel()
+        self.velocityModel = None
+        self.locatorTimer = QtCore.QTimer(self)
+        self.locatorTimer.setInterval(200)
+        self.connect(self.locatorTimer, QtCore.SIGNAL("timeout()"),
+                     self._checkLocatorJob)
         # indicates which of the available events from seishub was loaded
         self.seishubEventCurrent = None 
         # indicates how many events are available from seishub
@@ -223,8 +286,11 @@ class ObsPyck(QtGui.QMainWindow):
         server['BaseUrl'] = "http://" + server['Server']
         server['User'] = options.seishub_user # "obspyck"
         
-        (warn_msg, merge_msg, streams) = \
-                merge_check_and_cleanup_streams(streams, options)
+        if cleaned:
+            warn_msg, merge_msg = "", ""
+        else:
+            (warn_msg, merge_msg, streams) = \
+                    merge_check_and_cleanup_streams(streams, options)
         # if it's not empty show the merge info message now
         if merge_msg:
             self.info(merge_msg)
@@ -239,13 +305,41 @@ class ObsPyck(QtGui.QMainWindow):
 
         # sort streams by station name
         streams.sort(key=lambda st: st[0].stats['station'])
-        streams = cleanup_streams(streams, options)
-        self.streams_bkp = [st.copy() for st in streams]
+        if not cleaned:
+            streams = cleanup_streams(streams, options)
+            if options.waveform_store:
+                try:
+                    save_streams(options.waveform_store, streams, options)
+                except Exception, e:
+                    msg = "Could not write waveform store '%s': %s" % \
+                          (options.waveform_store, e)
+                    self.error(msg)
+        # the raw data is kept in streams_bkp, self.streams holds what is
+        # displayed. unprocessed streams share the raw sample arrays, they
+        # only get copied when processing is switched on
+        # (see updateCurrentStream)
+        self.streams_bkp = streams
+        self.streams = [stream_view(st) for st in streams]
+        # lookup of stream position by (network, station, location) and of
+        # traces by channel per stream position, see getStream()/getTrace().
+        # positions don't change when streams get replaced by processed ones
+        self.streamIndex = {}
+        for i, st in enumerate(streams):
+            stats = st[0].stats
+            self.streamIndex.setdefault(
+                (stats.network, stats.station, stats.location), i)
+        self.traceIndex = {}
+        # keeps memory used by waveform data below --max-memory by spilling
+        # raw data of stations not viewed recently to disk
+        self.memoryManager = MemoryManager(
+            self.streams_bkp, self.streams,
+            max_bytes=int(options.max_memory * 1024 ** 2), dir=self.tmp_dir)
         # XXX TODO replace old 'eventMapColors'
 
         #Define a pointer to navigate through the streams
         self.stNum = len(streams)
         self.stPt = 0
+        self.touchCurrentStream()
 
         self.drawAxes()
         self.multicursor = MultiCursor(self.canv, self.axs, useblit=True,
@@ -289,7 +383,9 @@ class ObsPyck(QtGui.QMainWindow):
         # XXX XXX the good old focus issue again!?! no events get to the mpl canvas
         # XXX self.canv.setFocusPolicy(Qt.WheelFocus)
         #print self.canv.hasFocus()
-        if 'SeisHub' in self.clients:
+        if session is not None:
+            self.restoreSession(session)
+        elif 'SeisHub' in self.clients:
             self.updateEventListFromSeisHub(self.T0, self.T1)
         self.setFocusToMatplotlib()
 
@@ -299,6 +395,18 @@ class ObsPyck(QtGui.QMainWindow):
         """
         return self.streams[self.stPt]
 
+    def touchCurrentStream(self):
+        """
+        Tells the memory manager which stream is displayed now, which loads
+        its data back into memory if necessary and spills other streams to
+        disk if the memory budget is exceeded.
+        """
+        evicted = self.memoryManager.touch(self.stPt)
+        if evicted:
+            msg = "Moved data of %i station(s) to disk (memory budget: " + \
+                  "%.1f MB)"
+            self.debug(msg % (len(evicted), self.options.max_memory))
+
     def getCurrentPhase(self):
         """
         returns currently active phase as a string
@@ -336,6 +444,13 @@ class ObsPyck(QtGui.QMainWindow):
         """
         if 'SeisHub' in self.clients:
             self.checkForSysopEventDuplicates(self.T0, self.T1)
+        self.spectrogramTimer.stop()
+        self.spectrogramCache.close()
+        self.eventInfoTimer.stop()
+        self.locatorTimer.stop()
+        if self.locatorJob is not None:
+            self.locatorJob.cancel()
+        self.memoryManager.close()
         try:
             shutil.rmtree(self.tmp_dir)
         except:
@@ -398,37 +513,127 @@ class ObsPyck(QtGui.QMainWindow):
     def on_qToolButton_doHyp2000_clicked(self, *args):
         if args:
             return
+        if self.isLocatorJobRunning():
+            return
         #self.delAllItems()
-        self.clearOriginMagnitude()
-        self.setXMLEventID()
-        self.doHyp2000()
-        self.loadHyp2000Data()
-        self.calculateEpiHypoDists()
-        self.updateMagnitude()
-        self.updateAllItems()
-        self.redraw()
-        self.widgets.qToolButton_showMap.setChecked(True)
+        # the current origin stays until the results are accepted, see
+        # finishHyp2000()
+        self.startLocatorJob(self.doHyp2000(), self.finishHyp2000)
 
     def on_qToolButton_doNlloc_clicked(self, *args):
         if args:
             return
+        if self.isLocatorJobRunning():
+            return
         #self.delAllItems()
+        # the current origin stays until the results are accepted, see
+        # finishNLLoc()
+        self.startLocatorJob(self.doNLLoc(), self.finishNLLoc)
+
+    def on_qToolButton_doGridSearch_clicked(self, *args):
+        if args:
+            return
+        if self.isLocatorJobRunning():
+            return
         self.clearOriginMagnitude()
         self.setXMLEventID()
-        self.doNLLoc()
-        self.loadNLLocOutput()
+        # runs in-process and is fast, no need for a background job
+        if not self.doGridSearch():
+            return
+        self.leaveSpecialViews()
         self.calculateEpiHypoDists()
         self.updateMagnitude()
         self.updateAllItems()
         self.redraw()
         self.widgets.qToolButton_showMap.setChecked(True)
 
+    def on_qToolButton_compareNlloc_clicked(self, *args):
+        if args:
+            return
+        if self.isLocatorJobRunning():
+            return
+        combo = self.widgets.qComboBox_nllocModel
+        models = [str(combo.itemText(i)) for i in xrange(combo.count())]
+        self.critical('Phases for NLLoc:')
+        self.critical(self.dicts2NLLocPhases())
+        jobs = [self.doNLLoc(model, verbose=False) for model in models]
+        self.clearNLLocComparison()
+        self.nllocComparison = [(model, job.workspace, None)
+                                for model, job in zip(models, jobs)]
+        group = LocatorJobGroup("NLLoc (all models)", jobs,
+                                keep_workspaces=True)
+        self.startLocatorJob(group, self.finishNLLocComparison)
+        self.nllocComparisonSnapshot = self.locatorSnapshot
+
+    def on_qToolButton_resampleLocation_clicked(self, *args):
+        if args:
+            return
+        if self.isLocatorJobRunning():
+            return
+        locator = self.getOriginLocator()
+        if locator is None:
+            err = "Error: Resampling needs a hyp2000 or NLLoc location."
+            self.error(err)
+            return
+        stations = sorted(set(pick.waveform_id.station_code
+                              for pick in self.catalog[0].picks
+                              if pick.waveform_id is not None))
+        if len(stations) < 4:
+            err = "Error: Resampling needs picks of at least 4 stations."
+            self.error(err)
+            return
+        # relocate with the model of the origin, not the one selected now
+        model = None
+        earth_model_id = self.catalog[0].origins[0].earth_model_id
+        if locator == "NLLoc" and earth_model_id is not None:
+            model = str(earth_model_id).split("/")[-1]
+        # reference location with all stations, leave-one-station-out
+        # (jackknife) and random subsets leaving out about sqrt(n) stations
+        # (delete-d jackknife, a station can only be used once in a
+        # location, so no bootstrap with replacement). at least 3 stations
+        # are kept.
+        n = len(stations)
+        deleted = int(max(1, min(round(math.sqrt(n)), n - 3)))
+        subsets = [("all", None)]
+        subsets += [("without %s" % sta,
+                     [other for other in stations if other != sta])
+                    for sta in stations]
+        random = np.random.RandomState()
+        for i in xrange(self.options.resampling_subsets):
+            keep = sorted(random.permutation(n)[:n - deleted])
+            subsets.append(("subset %i" % (i + 1),
+                            [stations[j] for j in keep]))
+        jobs = []
+        for name, subset in subsets:
+            if locator == "hyp2000":
+                job = self.doHyp2000(stations=subset, verbose=False)
+            else:
+                job = self.doNLLoc(model, verbose=False, stations=subset)
+            job.name = "%s (%s)" % (locator, name)
+            jobs.append(job)
+        self.critical("Relocating with %s for %i station subsets..." % (
+            locator, len(jobs) - 1))
+        group = LocatorJobGroup("%s resampling" % locator, jobs,
+                                output=False)
+        self.startLocatorJob(group, self.finishResampling, locator, stations,
+                             deleted)
+
     def on_qToolButton_doFocMec_clicked(self, *args):
         if args:
             return
+        if self.isLocatorJobRunning():
+            return
         self.clearFocmec()
-        self.doFocmec()
-        self.setXMLEventID()
+        job, count = self.doFocmec()
+        self.startLocatorJob(job, self.finishFocmec, count)
+
+    def on_qToolButton_cancelLocator_clicked(self, *args):
+        if args:
+            return
+        if self.locatorJob is None:
+            return
+        self.critical("cancelling %s..." % self.locatorJob.name)
+        self.locatorJob.cancel()
 
     def on_qToolButton_showMap_toggled(self):
         state = self.widgets.qToolButton_showMap.isChecked()
@@ -644,6 +849,11 @@ class ObsPyck(QtGui.QMainWindow):
             return
         self.save_event_locally()
 
+    def on_qToolButton_saveSession_clicked(self, *args):
+        if args:
+            return
+        self.saveSession()
+
     def on_qCheckBox_sysop_toggled(self):
         self.on_qLineEdit_sysopPassword_editingFinished()
         newstate = self.widgets.qCheckBox_sysop.isChecked()
@@ -694,7 +904,8 @@ class ObsPyck(QtGui.QMainWindow):
         if not isinstance(newvalue, int):
             return
         self.stPt = self.widgets.qComboBox_streamName.currentIndex()
-        self.streams[self.stPt] = self.streams_bkp[self.stPt].copy()
+        self.touchCurrentStream()
+        self.streams[self.stPt] = stream_view(self.streams_bkp[self.stPt])
         stats = self.streams[self.stPt][0].stats
         self.info("Going to stream: %s.%s" % (stats.network, stats.station))
         self.drawStream()
@@ -857,10 +1068,18 @@ class ObsPyck(QtGui.QMainWindow):
             widget = getattr(self.widgets, name)
             widget.setEnabled(not state)
         if state:
-            msg = "Showing spectrograms (takes a few seconds with log-option)."
+            msg = ("Showing spectrograms (seismograms are shown until "
+                   "computation in background is finished).")
         else:
             msg = "Showing seismograms."
         self.info(msg)
+        self.redrawSpectrograms()
+
+    def redrawSpectrograms(self):
+        """
+        Redraws the stream view after a change of spectrogram settings or
+        when background computation of spectrograms has finished.
+        """
         xmin, xmax = self.axs[0].get_xlim()
         #self.delAllItems()
         self.delAxes()
@@ -1133,13 +1352,15 @@ class ObsPyck(QtGui.QMainWindow):
         self.multicursorReinit()
         self.axs[0].set_xlim(xmin, xmax)
         self.updatePlot()
-        ymax = max([max(abs(p.get_ydata())) for p in self.plts])
-        if self.widgets.qToolButton_trigger.isChecked():
-            ymin = 0
-        else:
-            ymin = -ymax
-        for ax in self.axs:
-            ax.set_ybound(upper=ymax, lower=ymin)
+        # no waveform plots if all spectrograms are shown
+        if self.plts:
+            ymax = max([max(abs(p.get_ydata())) for p in self.plts])
+            if self.widgets.qToolButton_trigger.isChecked():
+                ymin = 0
+            else:
+                ymin = -ymax
+            for ax in self.axs:
+                ax.set_ybound(upper=ymax, lower=ymin)
         self.redraw()
 
     def drawAxes(self):
@@ -1153,6 +1374,10 @@ class ObsPyck(QtGui.QMainWindow):
         self.trans = trans
         t = []
         self.t = t
+        spectrograms_pending = False
+        # no need to compute more spectrogram columns than there are pixels,
+        # round up to avoid recomputation on small changes of window size
+        spectrogram_columns = int(math.ceil(self.fig.bbox.width / 256.0)) * 256
         for i, tr in enumerate(st):
             if i == 0:
                 ax = fig.add_subplot(len(st), 1, 1)
@@ -1173,12 +1398,23 @@ class ObsPyck(QtGui.QMainWindow):
             trans.append(matplotlib.transforms.blended_transform_factory(ax.transData,
                                                                          ax.transAxes))
             ax.xaxis.set_major_formatter(FuncFormatter(formatXTicklabels))
+            spec = None
             if self.widgets.qToolButton_spectrogram.isChecked():
-                log = self.widgets.qCheckBox_spectrogramLog.isChecked()
                 wlen = self.widgets.qDoubleSpinBox_wlen.value()
                 perlap = self.widgets.qDoubleSpinBox_perlap.value()
-                spectrogram(tr.data, tr.stats.sampling_rate, log=log, wlen=wlen, per_lap=perlap,
-                            cmap=self.spectrogramColormap, axes=ax, zorder=-10)
+                spec = self.spectrogramCache.get(
+                    tr, wlen, perlap, max_columns=spectrogram_columns,
+                    tag=self.getProcessingState())
+                if spec is None:
+                    spectrograms_pending = True
+                elif spec is FAILED:
+                    # error was reported already, show the waveform
+                    spec = None
+            if spec is not None:
+                log = self.widgets.qCheckBox_spectrogramLog.isChecked()
+                plot_spectrogram(ax, *spec, log=log,
+                                 cmap=self.spectrogramColormap, zorder=-10,
+                                 offset=starttime_relative)
                 textcolor = "red"
             else:
                 # normalize with overall sensitivity and convert to nm/s
@@ -1188,6 +1424,8 @@ class ObsPyck(QtGui.QMainWindow):
                 else:
                     plts.append(ax.plot(sampletimes, tr.data, color='k', zorder=1000)[0])
                 textcolor = "blue"
+        if spectrograms_pending:
+            self.spectrogramTimer.start()
         self.drawIds()
         axs[-1].xaxis.set_ticks_position("both")
         label = self.T0.isoformat().replace("T", "  ")
@@ -1197,6 +1435,86 @@ class ObsPyck(QtGui.QMainWindow):
         self.yMin, self.yMax = axs[0].get_ylim()
         fig.subplots_adjust(bottom=0.001, hspace=0.000, right=0.999, top=0.999, left=0.001)
     
+    def getProcessingState(self):
+        """
+        Returns a tuple describing the processing currently selected in the
+        GUI (filter, rotation, trigger).
+        """
+        w = self.widgets
+        state = []
+        if w.qToolButton_filter.isChecked():
+            state += [str(w.qComboBox_filterType.currentText()),
+                      w.qDoubleSpinBox_corners.value(),
+                      w.qCheckBox_zerophase.isChecked(),
+                      w.qCheckBox_50Hz.isChecked(),
+                      w.qDoubleSpinBox_highpass.value(),
+                      w.qDoubleSpinBox_lowpass.value()]
+        if w.qToolButton_rotateLQT.isChecked():
+            state.append("LQT")
+        elif w.qToolButton_rotateZRT.isChecked():
+            state.append("ZRT")
+        if w.qToolButton_trigger.isChecked():
+            state += ["recstalta", w.qDoubleSpinBox_sta.value(),
+                      w.qDoubleSpinBox_lta.value()]
+        return tuple(state)
+
+    def _checkSpectrograms(self):
+        """
+        Called periodically while spectrograms are computed in the
+        background. Redraws the stream view when all are finished.
+        """
+        cache = self.spectrogramCache
+        for err in cache.pop_errors():
+            self.error(err)
+        if cache.is_busy():
+            return
+        self.spectrogramTimer.stop()
+        w = self.widgets
+        if not w.qToolButton_spectrogram.isChecked():
+            return
+        for name in ("qToolButton_overview", "qToolButton_showMap",
+                     "qToolButton_showFocMec", "qToolButton_showWadati"):
+            if getattr(w, name).isChecked():
+                return
+        self.info("Showing spectrograms.")
+        self.redrawSpectrograms()
+
+    def _checkEventInfo(self):
+        """
+        Called periodically while events and theoretical arrivals are looked
+        up in the background. Shows the arrivals when they are determined.
+        """
+        lookup = self.eventInfoLookup
+        if lookup.is_running():
+            return
+        self.eventInfoTimer.stop()
+        self.eventInfoLookup = None
+        fdsn_events, taup_arrivals, msg = lookup.result
+        if msg:
+            self.error(msg)
+        if fdsn_events is None:
+            self.error("Could not determine possible arrivals using "
+                       "obspy.fdsn/taup.")
+            return
+        self.taup_arrivals = taup_arrivals
+        msg = ["%i event(s) with possible arrivals found using "
+               "obspy.fdsn/taup:" % len(fdsn_events)]
+        for ev in fdsn_events:
+            o = ev.origins[0]
+            m = ev.magnitudes and ev.magnitudes[0] or AttribDict()
+            msg.append(" ".join([str(o.time), str(m.get("magnitude_type")),
+                                 str(m.get("mag")), str(o.region)]))
+        self.info("\n".join(msg))
+        if not taup_arrivals:
+            return
+        w = self.widgets
+        for name in ("qToolButton_overview", "qToolButton_showMap",
+                     "qToolButton_showFocMec", "qToolButton_showWadati"):
+            if getattr(w, name).isChecked():
+                return
+        self.redrawTheoreticalArrivals()
+        self.redraw()
+
     def delAxes(self):
         for ax in self.axs:
             if ax in self.fig.axes: 
@@ -1215,10 +1533,12 @@ class ObsPyck(QtGui.QMainWindow):
         Update current stream either with raw/rotated/filtered data
         according to current button settings in GUI.
         """
-        # XXX copying is only necessary if "Filter" or "Rotate" is selected
-        # XXX it is simpler for the code to just copy in any case..
-        self.streams[self.stPt] = self.streams_bkp[self.stPt].copy()
+        # sample arrays are shared with the raw data and only get copied if
+        # any processing is selected
+        self.streams[self.stPt] = stream_view(self.streams_bkp[self.stPt])
         st = self.streams[self.stPt]
+        if self.getProcessingState():
+            make_writeable(st)
         # To display filtered data we overwrite our alias to current stream
         # and replace it with the filtered data.
         if self.widgets.qToolButton_filter.isChecked():
@@ -1254,6 +1574,8 @@ class ObsPyck(QtGui.QMainWindow):
                 self.widgets.qToolButton_trigger.setChecked(False)
                 err = "Error during triggering. Showing waveform data."
                 self.error(err)
+        # processing routines might return data in double precision
+        apply_precision(st, self.options.precision)
 
     def updatePlot(self, keep_ylims=True):
         """
@@ -1435,6 +1757,8 @@ class ObsPyck(QtGui.QMainWindow):
                 elif ev.key == keys['setMagMax']:
                     val = np.max(ydata[xpos-MAG_PICKWINDOW:xpos+MAG_PICKWINDOW])
                     tmp_magtime = cutoffSamples + np.argmax(ydata[xpos-MAG_PICKWINDOW:xpos+MAG_PICKWINDOW])
+                # store as python float independent of working precision
+                val = float(val)
                 # XXX TODO GSE calib handling! special handling for GSE2 data: apply calibration
                 if tr.stats._format == "GSE2":
                     val = val / (tr.stats.calib * 2 * np.pi / tr.stats.gse2.calper)
@@ -1633,7 +1957,7 @@ class ObsPyck(QtGui.QMainWindow):
         self.updateStreamNameCombobox()
 
     def doFocmec(self):
-        prog_dict = PROGRAMS['focmec']
+        prog_dict = create_workspace('focmec', self.tmp_dir)
         files = prog_dict['files']
         f = open(files['phases'], 'wt')
         f.write("\n") #first line is ignored!
@@ -1642,8 +1966,7 @@ class ObsPyck(QtGui.QMainWindow):
         fmt = "%4s  %6.2f  %6.2f%1s\n"
         count = 0
         for pick in self.catalog[0].picks:
-            arrival = getArrivalForPick(self.catalog[0].origins[0].arrivals,
-                                        pick)
+            arrival = self.getArrivalForPick(pick)
             if arrival is None:
                 self.critical("focmec: No arrival for pick. "
                               "Skipping:\n%s" % pick)
@@ -1697,15 +2020,13 @@ class ObsPyck(QtGui.QMainWindow):
         f.close()
         self.critical('Phases for focmec: %i' % count)
         self.catFile(files['phases'], self.critical)
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict)
-        self.info(msg)
-        self.error(err)
-        if returncode == 1:
-            err = "Error: focmec did not find a suitable solution!"
-            self.error(err)
-            return
-        self.critical('--> focmec finished')
+        job = LocatorJob("focmec", prog_dict['Call'], prog_dict)
+        job.workspace = prog_dict
+        return job, count
+
+    def loadFocmecOutput(self, count, files=None):
+        if files is None:
+            files = PROGRAMS['focmec']['files']
         lines = open(files['summary'], "rt").readlines()
         self.critical('%i suitable solutions found:' % len(lines))
         fms = []
@@ -1742,6 +2063,7 @@ class ObsPyck(QtGui.QMainWindow):
         fm = fms[self.focMechCurrent]
         np1 = fm.nodal_planes.nodal_plane_1
         self.catalog[0].preferred_focal_mechanism_id = str(fm.resource_id)
+        self.setCatalogModified()
         self.critical("selecting Focal Mechanism No. %2i of %2i:" % \
                       (self.focMechCurrent + 1, len(fms)))
         self.critical("Strike: %6.2f  Dip: %6.2f  Rake: %6.2f  Misfit: %.2f" % \
@@ -1791,7 +2113,7 @@ class ObsPyck(QtGui.QMainWindow):
             net = st[0].stats.network
             sta = st[0].stats.station
             pick = self.getPick(network=net, station=sta, phase_hint='P')
-            arrival = getArrivalForPick(self.catalog[0].origins[0].arrivals, pick)
+            arrival = self.getArrivalForPick(pick)
             if not pick:
                 continue
             if pick.polarity is None or arrival is None or arrival.azimuth is None or arrival.takeoff_angle is None:
@@ -1827,18 +2149,22 @@ class ObsPyck(QtGui.QMainWindow):
                     self.fig.delaxes(ax)
                 del ax
 
-    def doHyp2000(self):
+    def doHyp2000(self, stations=None, verbose=True):
         """
-        Writes input files for hyp2000 and starts the hyp2000 program via a
-        system call.
+        Writes input files for hyp2000 and returns a (not yet started)
+        :class:`LocatorJob` for the hyp2000 program call.
+
+        :param stations: Station codes whose picks should be used, defaults
+            to all.
+        :param verbose: Whether to show the phase and station files.
         """
-        prog_dict = PROGRAMS['hyp_2000']
+        prog_dict = create_workspace('hyp_2000', self.tmp_dir)
         files = prog_dict['files']
         precall = prog_dict['PreCall']
         precall(prog_dict)
 
         f = open(files['phases'], 'wt')
-        phases_hypo71 = self.dicts2hypo71Phases()
+        phases_hypo71 = self.dicts2hypo71Phases(stations)
         f.write(phases_hypo71)
         f.close()
 
@@ -1847,160 +2173,565 @@ class ObsPyck(QtGui.QMainWindow):
         f2.write(stations_hypo71)
         f2.close()
 
-        self.critical('Phases for Hypo2000:')
-        self.catFile(files['phases'], self.critical)
-        self.critical('Stations for Hypo2000:')
-        self.catFile(files['stations'], self.critical)
+        if verbose:
+            self.critical('Phases for Hypo2000:')
+            self.catFile(files['phases'], self.critical)
+            self.critical('Stations for Hypo2000:')
+            self.catFile(files['stations'], self.critical)
 
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict)
-        self.info(msg)
-        self.error(err)
-        self.critical('--> hyp2000 finished')
-        self.catFile(files['summary'], self.critical)
+        job = LocatorJob("hyp2000", prog_dict['Call'], prog_dict)
+        job.workspace = prog_dict
+        return job
 
-    def doNLLoc(self):
+    def doNLLoc(self, model=None, verbose=True, stations=None):
         """
-        Writes input files for NLLoc and starts the NonLinLoc program via a
-        system call.
+        Writes input files for NLLoc and returns a (not yet started)
+        :class:`LocatorJob` for the NonLinLoc program call.
+
+        :param model: Velocity model to use, defaults to the one selected in
+            the GUI.
+        :param verbose: Whether to show the phase file.
+        :param stations: Station codes whose picks should be used, defaults
+            to all.
         """
-        prog_dict = PROGRAMS['nlloc']
+        prog_dict = create_workspace('nlloc', self.tmp_dir)
         files = prog_dict['files']
         # determine which model should be used in location
-        controlfilename = "locate_%s.nlloc" % \
-                          str(self.widgets.qComboBox_nllocModel.currentText())
+        if model is None:
+            model = str(self.widgets.qComboBox_nllocModel.currentText())
+        controlfilename = "locate_%s.nlloc" % model
 
         precall = prog_dict['PreCall']
         precall(prog_dict)
 
         f = open(files['phases'], 'wt')
-        phases_nlloc = self.dicts2NLLocPhases()
+        phases_nlloc = self.dicts2NLLocPhases(stations)
         f.write(phases_nlloc)
         f.close()
 
-        self.critical('Phases for NLLoc:')
-        self.catFile(files['phases'], self.critical)
+        if verbose:
+            self.critical('Phases for NLLoc:')
+            self.catFile(files['phases'], self.critical)
 
-        call = prog_dict['Call']
-        (msg, err, returncode) = call(prog_dict, controlfilename)
-        self.info(msg)
-        self.error(err)
-        self.critical('--> NLLoc finished')
-        self.catFile(files['summary'], self.critical)
+        job = LocatorJob("NLLoc %s" % model, prog_dict['Call'], prog_dict,
+                         controlfilename)
+        prog_dict['model'] = model
+        job.workspace = prog_dict
+        return job
 
-    def catFile(self, file, logfunct):
-        lines = open(file, "rt").readlines()
-        msg = ""
-        for line in lines:
-            msg += line
-        logfunct(msg)
+    def getVelocityModel(self):
+        """
+        Returns the travel time table (see
+        :class:`traveltime_helper.TravelTimeTable`) of the layered velocity
+        model used by the built-in grid search, read from the file given
+        with --velocity-model (or the default model). The table is cached in
+        the file given with --traveltime-table.
+        """
+        if self.velocityModel is None:
+            filename = self.options.velocity_model
+            if filename:
+                name = os.path.splitext(os.path.basename(filename))[0]
+                model = LayeredModel(read_velocity_model(filename), name)
+            else:
+                model = LayeredModel(DEFAULT_MODEL)
+            self.velocityModel = get_travel_time_table(
+                model, self.options.traveltime_table)
+        return self.velocityModel
 
-    def loadNLLocOutput(self):
-        files = PROGRAMS['nlloc']['files']
-        lines = open(files['summary'], "rt").readlines()
-        if not lines:
-            err = "Error: NLLoc output file (%s) does not exist!" % \
-                    files['summary']
+    def doGridSearch(self):
+        """
+        Locates the event in-process with a grid search over hypocenters
+        (see :func:`gridsearch_helper.grid_search`) and sets up origin and
+        arrivals just like :meth:`loadNLLocOutput` does for NLLoc.
+
+        :returns: True if the event was located.
+        """
+        coordinates = {}
+        for st in self.streams:
+            coordinates.setdefault(st[0].stats.station,
+                                   st[0].stats.coordinates)
+        picks = []
+        for pick in self.catalog[0].picks:
+            if pick.phase_hint not in ("P", "S") or pick.waveform_id is None:
+                continue
+            sta = pick.waveform_id.station_code
+            if sta not in coordinates:
+                continue
+            # same pick errors as used for NLLoc
+            error = None
+            if pick.time_errors.upper_uncertainty and \
+                    pick.time_errors.lower_uncertainty:
+                error = pick.time_errors.upper_uncertainty + \
+                        pick.time_errors.lower_uncertainty
+            elif pick.time_errors.uncertainty:
+                error = 2 * pick.time_errors.uncertainty
+            if error is None:
+                err = "Warning: Missing pick error. " + \
+                      "Discarding %s phase of station %s."
+                self.error(err % (pick.phase_hint, sta))
+                continue
+            picks.append((pick, coordinates[sta], error))
+        if len(picks) < 4:
+            err = "Error: Grid search needs at least 4 picks with errors."
             self.error(err)
+            return False
+
+        model = self.getVelocityModel()
+        reference = min(pick.time for pick, coords, error in picks)
+        start = UTCDateTime()
+        result = grid_search(
+            model, [coords.latitude for pick, coords, error in picks],
+            [coords.longitude for pick, coords, error in picks],
+            [coords.elevation for pick, coords, error in picks],
+            [pick.phase_hint for pick, coords, error in picks],
+            [pick.time - reference for pick, coords, error in picks],
+            [error for pick, coords, error in picks])
+        self.critical("--> grid search finished (%.2f s)" %
+                      (UTCDateTime() - start))
+
+        # standard deviations, doubled to approximately get the 95%
+        # confidence level like for NLLoc (see loadNLLocOutput())
+        errX, errY, errZ = [2 * float(err) for err in result['errors']]
+
+        catalog = self.catalog
+        event = catalog[0]
+        if event.creation_info is None:
+            event.creation_info = CreationInfo()
+            event.creation_info.creation_time = UTCDateTime()
+        o = Origin()
+        event.origins = [o]
+        o.creation_info = CreationInfo(creation_time=UTCDateTime())
+
+        # assign origin info
+        o.method_id = "/".join([ID_ROOT, "location_method", "gridsearch",
+                                "1"])
+        o.origin_uncertainty = OriginUncertainty()
+        o.quality = OriginQuality()
+        ou = o.origin_uncertainty
+        oq = o.quality
+        o.longitude = float(result['longitude'])
+        o.latitude = float(result['latitude'])
+        o.depth = float(result['depth']) * 1e3  # meters positive down!
+        if errY > errX:
+            ou.azimuth_max_horizontal_uncertainty = 0
+        else:
+            ou.azimuth_max_horizontal_uncertainty = 90
+        ou.min_horizontal_uncertainty, \
+                ou.max_horizontal_uncertainty = \
+                sorted([errX * 1e3, errY * 1e3])
+        ou.preferred_description = "uncertainty ellipse"
+        o.depth_errors.uncertainty = errZ * 1e3
+        oq.standard_error = float(result['rms'])
+        o.depth_type = "from location"
+        o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model.name)
+        o.time = reference + float(result['time'])
+
+        o.quality.used_phase_count = 0
+        o.quality.extra = AttribDict()
+        o.quality.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
+        o.quality.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
+        used_stations = set()
+        for i, (pick, coords, error) in enumerate(picks):
+            arrival = Arrival(origin=o, pick=pick)
+            arrival.distance = kilometer2degrees(
+                float(result['distances'][i]))
+            arrival.phase = pick.phase_hint
+            arrival.time_residual = float(result['residuals'][i])
+            arrival.azimuth = float(result['azimuths'][i])
+            arrival.takeoff_angle = float(result['takeoff_angles'][i])
+            # all picks are used with their errors as weights
+            arrival.time_weight = 1.0
+            o.quality.used_phase_count += 1
+            if pick.phase_hint == "P":
+                o.quality.extra.usedPhaseCountP['value'] += 1
+            else:
+                o.quality.extra.usedPhaseCountS['value'] += 1
+            used_stations.add(pick.waveform_id.station_code)
+        o.used_station_count = len(used_stations)
+        self.update_origin_azimuthal_gap()
+        self.critical("Grid search location: %.4f %.4f, depth %.2f km, "
+                      "origin time %s, rms %.3f s" % (
+                          o.latitude, o.longitude, o.depth / 1e3, o.time,
+                          oq.standard_error))
+        return True
+
+    def isLocatorJobRunning(self):
+        if self.locatorJob is None:
+            return False
+        self.error("Error: %s is still running." % self.locatorJob.name)
+        return True
+
+    def getLocatorSnapshot(self):
+        """
+        Returns the current event and the state of its picks, to detect
+        changes while a locator runs in the background (see
+        :meth:`startLocatorJob`).
+        """
+        event = self.catalog[0]
+        return (event, [(str(pick.resource_id), pick.isModified())
+                        for pick in event.picks])
+
+    def startLocatorJob(self, job, finish, *args):
+        """
+        Starts given :class:`LocatorJob` in the background. When it is
+        finished, `finish` gets called with the job and `args` to process the
+        results. In the meantime picking etc. stays possible, but results
+        are discarded if the event or its picks changed in the meantime.
+        """
+        # changed picks get their new resource_ids now, any later change
+        # shows in the snapshot
+        commitResourceIDs(self.catalog)
+        self.locatorJob = job
+        self.locatorFinish = (finish, args)
+        self.locatorSnapshot = self.getLocatorSnapshot()
+        self.widgets.qToolButton_cancelLocator.setEnabled(True)
+        job.start()
+        self.locatorTimer.start()
+
+    def _checkLocatorJob(self):
+        """
+        Called periodically while a locator program runs in the background.
+        Shows its output and processes the results when it is finished.
+        """
+        job = self.locatorJob
+        running = job.is_running()
+        lines = job.pop_output()
+        if lines:
+            self.info("".join(lines).rstrip("\n"))
+        if running:
             return
-        # goto signature info line
+        self.locatorTimer.stop()
+        self.widgets.qToolButton_cancelLocator.setEnabled(False)
+        self.locatorJob = None
+        finish, args = self.locatorFinish
+        self.locatorFinish = None
+        event, picks = self.locatorSnapshot
+        self.locatorSnapshot = None
         try:
-            line = lines.pop(0)
-            while not line.startswith("SIGNATURE"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
+            if job.exception is not None:
+                self.error("Error: running %s failed: %s" % (job.name,
+                                                             job.exception))
+                return
+            if job.cancelled:
+                self.critical("--> %s cancelled" % job.name)
+                return
+            (msg, err, returncode) = job.result
             self.error(err)
-            return
+            event_, picks_ = self.getLocatorSnapshot()
+            if event_ is not event or picks_ != picks:
+                self.error("Error: Event or picks changed while %s was "
+                           "running, discarding its results." % job.name)
+                return
+            # results are shown in the stream view, leave other views
+            self.leaveSpecialViews()
+            finish(job, *args)
+        finally:
+            job.cleanup()
+
+    def finishHyp2000(self, job):
+        files = job.workspace['files']
+        self.critical('--> hyp2000 finished')
+        self.catFile(files['summary'], self.critical)
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.loadHyp2000Data(files)
+        self.calculateEpiHypoDists()
+        self.updateMagnitude()
+        self.updateAllItems()
+        self.redraw()
+        self.widgets.qToolButton_showMap.setChecked(True)
 
-        line = line.rstrip().split('"')[1]
-        signature, nlloc_version, date, time = line.rsplit(" ", 3)
-        creation_time = UTCDateTime().strptime(date + time, str("%d%b%Y%Hh%Mm%S"))
+    def leaveSpecialViews(self):
+        """
+        Switches from map/focal mechanism/wadati view back to the stream
+        view.
+        """
+        for name in ("qToolButton_showMap", "qToolButton_showFocMec",
+                     "qToolButton_showWadati"):
+            getattr(self.widgets, name).setChecked(False)
 
-        # goto maximum likelihood origin location info line
+    def finishNLLoc(self, job):
+        files = job.workspace['files']
+        self.critical('--> NLLoc finished')
+        self.catFile(files['summary'], self.critical)
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.showNLLocOutput(files, job.workspace['model'])
+
+    def showNLLocOutput(self, files, model=None):
+        """
+        Makes the location in given NLLoc output files the current origin.
+        """
+        self.loadNLLocOutput(files, model)
+        self.calculateEpiHypoDists()
+        self.updateMagnitude()
+        self.updateAllItems()
+        self.redraw()
+        self.widgets.qToolButton_showMap.setChecked(True)
+
+    def finishNLLocComparison(self, group):
+        self.critical('--> NLLoc finished for all models')
+        for i, (model, workspace, summary) in \
+                enumerate(self.nllocComparison):
+            job = group.jobs[i]
+            if job.exception is not None:
+                self.error("Error: running %s failed: %s" % (job.name,
+                                                             job.exception))
+                continue
+            try:
+                summary = read_nlloc_summary(workspace['files']['summary'])
+            except IOError:
+                summary = None
+            if summary is None:
+                self.error("Error: No location info found in NLLoc output "
+                           "for model %s." % model)
+            self.nllocComparison[i] = (model, workspace, summary)
+        self.showNLLocComparison()
+
+    def getOriginLocator(self):
+        """
+        Returns the locator ("hyp2000" or "NLLoc") that determined the
+        current origin (None if neither did).
+        """
+        origins = self.catalog[0].origins
+        if not origins or origins[0].method_id is None:
+            return None
+        method = str(origins[0].method_id).split("/")
+        if "hyp2000" in method:
+            return "hyp2000"
+        if "nlloc" in method:
+            return "NLLoc"
+        return None
+
+    def readLocatorSummary(self, locator, files):
+        """
+        Returns the location (see :func:`resampling_statistics`) in the
+        summary file of a hyp2000/NLLoc run or None.
+        """
         try:
-            line = lines.pop(0)
-            while not line.startswith("HYPOCENTER"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
+            if locator == "hyp2000":
+                return read_hyp2000_summary(files['summary'])
+            summary = read_nlloc_summary(files['summary'])
+        except IOError:
+            return None
+        if summary is None:
+            return None
+        lon, lat = latlongconv(summary['x'], summary['y'])
+        return {'time': summary['time'], 'latitude': lat, 'longitude': lon,
+                'depth': summary['depth'], 'rms': summary['rms']}
+
+    def finishResampling(self, group, locator, stations, deleted):
+        """
+        Estimates the location uncertainty from the relocations started in
+        :meth:`on_qToolButton_resampleLocation_clicked` (first job with all
+        stations, then one job per left out station, then the random
+        subsets leaving out `deleted` stations each).
+        """
+        locations = []
+        for job in group.jobs:
+            if job.exception is not None or job.workspace is None:
+                locations.append(None)
+                continue
+            locations.append(self.readLocatorSummary(locator,
+                                                     job.workspace['files']))
+        reference = locations[0]
+        if reference is None:
+            self.error("Error: %s found no location with all stations." %
+                       locator)
             return
-        
-        line = line.split()
-        x = float(line[2])
-        y = float(line[4])
-        depth = - float(line[6]) # depth: negative down!
+        n = len(stations)
+        jackknife = [(sta, loc) for sta, loc
+                     in zip(stations, locations[1:n + 1]) if loc is not None]
+        subsets = [loc for loc in locations[n + 1:] if loc is not None]
+        failed = len([loc for loc in locations if loc is None])
+        stats = resampling_statistics(reference, jackknife, subsets, n,
+                                      deleted)
+        msg = ["%s resampling: %i leave-one-station-out and %i "
+               "leave-%i-stations-out relocations (%i failed)" % (
+                   locator, len(jackknife), len(subsets), deleted, failed)]
+        fmt = "  %s: x %.2f km, y %.2f km, z %.2f km, time %.3f s"
+        if stats['jackknife'] is not None:
+            msg.append(fmt % (("jackknife standard error", ) +
+                              tuple(stats['jackknife'])))
+        if stats['subsets'] is not None:
+            msg.append(fmt % (("delete-%i jackknife standard error" % deleted,
+                               ) + tuple(stats['subsets'])))
+        if stats['shifts']:
+            msg.append("  hypocenter shift when leaving out station: " +
+                       ", ".join("%s %.2f km" % (sta, shift)
+                                 for sta, shift in stats['shifts']))
+        if stats['outliers']:
+            msg.append("  possible outlier stations: " +
+                       ", ".join(stats['outliers']))
+        msg = "\n".join(msg)
+        self.critical(msg)
+        # keep the estimate with the origin it belongs to
+        origins = self.catalog[0].origins
+        if origins and self.getOriginLocator() == locator:
+            origins[0].comments.append(Comment(text=msg))
+            self.setCatalogModified()
 
-        lon, lat = latlongconv(x, y)
+    def clearNLLocComparison(self):
+        """
+        Removes the NLLoc runs with all models and closes the comparison
+        dialog, e.g. when the event is cleared.
+        """
+        if self.locatorJob is not None and \
+                self.locatorFinish[0] == self.finishNLLocComparison:
+            # the programs still use the workspaces, they get removed when
+            # the (discarded, see startLocatorJob()) runs ended
+            self.locatorJob.keep_workspaces = False
+            self.locatorJob.cancel()
+        else:
+            for model, workspace, summary in self.nllocComparison:
+                remove_workspace(workspace)
+        self.nllocComparison = []
+        self.nllocComparisonSnapshot = None
+        if self.nllocComparisonDialog is not None:
+            self.nllocComparisonDialog.hide()
+
+    def showNLLocComparison(self):
+        """
+        Shows origin, RMS, gap and errors of the NLLoc runs with all models
+        in a table. Selecting a row makes that location the current origin.
+        """
+        if self.nllocComparisonDialog is None:
+            dialog = QtGui.QDialog(self)
+            dialog.setWindowTitle("NLLoc model comparison")
+            table = QtGui.QTableWidget(dialog)
+            table.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+            table.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+            table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+            layout = QtGui.QVBoxLayout(dialog)
+            layout.addWidget(table)
+            self.connect(table,
+                    QtCore.SIGNAL("currentCellChanged(int, int, int, int)"),
+                    self._nllocComparisonRowChanged)
+            dialog.table = table
+            self.nllocComparisonDialog = dialog
+        dialog = self.nllocComparisonDialog
+        table = dialog.table
+        header = ["model", "origin time", "latitude", "longitude",
+                  "depth [km]", "RMS [s]", "gap [deg]", "error X [km]",
+                  "error Y [km]", "error Z [km]"]
+        # do not pick a row while filling the table
+        table.blockSignals(True)
+        table.clear()
+        table.setColumnCount(len(header))
+        table.setHorizontalHeaderLabels(header)
+        table.setRowCount(len(self.nllocComparison))
+        for row, (model, workspace, summary) in \
+                enumerate(self.nllocComparison):
+            values = [model]
+            if summary is None:
+                values.append("failed")
+            else:
+                lon, lat = latlongconv(summary['x'], summary['y'])
+                # 68% confidence ellipsoid, scaled to approximately 95% as
+                # in loadNLLocOutput()
+                errors = [2 * err for err in
+                          errorEllipsoid2CartesianErrors(*summary['ellipsoid'])]
+                values += [str(summary['time']), "%.4f" % lat, "%.4f" % lon,
+                           "%.2f" % summary['depth'], "%.3f" % summary['rms'],
+                           "%.0f" % summary['gap']]
+                values += ["%.2f" % err for err in errors]
+            for column, value in enumerate(values):
+                table.setItem(row, column, QtGui.QTableWidgetItem(value))
+        table.resizeColumnsToContents()
+        table.blockSignals(False)
+        dialog.resize(table.horizontalHeader().length() + 50,
+                      dialog.sizeHint().height())
+        dialog.show()
+        dialog.raise_()
+
+    def _nllocComparisonRowChanged(self, row, column, previous_row,
+                                   previous_column):
+        if row < 0 or row == previous_row:
+            return
+        self.useNLLocComparisonRow(row)
 
-#        lon, lat = gk2lonlat(x, y)
-        
-        # goto origin time info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("GEOGRAPHIC  OT"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
+    def useNLLocComparisonRow(self, row):
+        """
+        Makes the location of given row of the model comparison the current
+        origin.
+        """
+        model, workspace, summary = self.nllocComparison[row]
+        if summary is None:
+            self.error("Error: No location for model %s." % model)
             return
-        
-        line = line.split()
-        year = int(line[2])
-        month = int(line[3])
-        day = int(line[4])
-        hour = int(line[5])
-        minute = int(line[6])
-        seconds = float(line[7])
-        time = UTCDateTime(year, month, day, hour, minute, seconds)
-
-        # goto location quality info line
-        try:
-            line = lines.pop(0)
-            while not line.startswith("QUALITY"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct location info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
+        if self.isLocatorJobRunning():
+            return
+        event, picks = self.nllocComparisonSnapshot
+        event_, picks_ = self.getLocatorSnapshot()
+        if event_ is not event or picks_ != picks:
+            self.error("Error: Picks changed since the NLLoc runs with all "
+                       "models, compare the models again.")
+            return
+        self.critical("Using NLLoc location with model %s." % model)
+        combo = self.widgets.qComboBox_nllocModel
+        index = combo.findText(model)
+        if index != -1:
+            combo.setCurrentIndex(index)
+        self.clearOriginMagnitude()
+        self.setXMLEventID()
+        self.leaveSpecialViews()
+        self.showNLLocOutput(workspace['files'], model)
+
+    def finishFocmec(self, job, count):
+        if job.result[2] == 1:
+            err = "Error: focmec did not find a suitable solution!"
             self.error(err)
             return
-        
-        line = line.split()
-        rms = float(line[8])
-        gap = float(line[12])
+        self.critical('--> focmec finished')
+        self.loadFocmecOutput(count, job.workspace['files'])
+        self.setXMLEventID()
+
+    def catFile(self, file, logfunct):
+        lines = open(file, "rt").readlines()
+        msg = ""
+        for line in lines:
+            msg += line
+        logfunct(msg)
+
+    def loadNLLocOutput(self, files=None, model=None):
+        """
+        Makes the location in the summary (.hyp) file of a NLLoc run the
+        current origin.
 
-        # goto location quality info line
+        :param model: Name of the velocity model used, read from the
+            control file of the run if not given.
+        """
+        if files is None:
+            files = PROGRAMS['nlloc']['files']
         try:
-            line = lines.pop(0)
-            while not line.startswith("STATISTICS"):
-                line = lines.pop(0)
-        except:
+            events = read_nlloc_hyp(files['summary'])
+        except (IOError, ValueError, IndexError, TypeError) as e:
+            err = "Error: Could not read NLLoc outputfile (%s): %s" % (
+                files['summary'], str(e))
+            self.error(err)
+            return
+        if not events or not events[0].is_complete():
             err = "Error: No correct location info found in NLLoc " + \
                   "outputfile (%s)!" % files['summary']
             self.error(err)
             return
-        
-        line = line.split()
+        if len(events) > 1:
+            err = "Warning: NLLoc outputfile (%s) holds %i locations, " + \
+                  "using the first one."
+            self.error(err % (files['summary'], len(events)))
+        nlloc_event = events[0]
+
+        lon, lat = latlongconv(nlloc_event.x, nlloc_event.y)
+
+#        lon, lat = gk2lonlat(x, y)
+
         # read in the error ellipsoid representation of the location error.
         # this is given as azimuth/dip/length of axis 1 and 2 and as length
         # of axis 3.
-        azim1 = float(line[20])
-        dip1 = float(line[22])
-        len1 = float(line[24])
-        azim2 = float(line[26])
-        dip2 = float(line[28])
-        len2 = float(line[30])
-        len3 = float(line[32])
-
         # XXX TODO save original nlloc error ellipse?!
-        errX, errY, errZ = errorEllipsoid2CartesianErrors(azim1, dip1, len1,
-                                                          azim2, dip2, len2,
-                                                          len3)
-        
+        errX, errY, errZ = errorEllipsoid2CartesianErrors(
+            *nlloc_event.ellipsoid)
+
         # XXX
         # NLLOC uses error ellipsoid for 68% confidence interval relating to
         # one standard deviation in the normal distribution.
@@ -2010,17 +2741,11 @@ class ObsPyck(QtGui.QMainWindow):
         errY *= 2
         errZ *= 2
 
-        # determine which model was used:
-        # XXX handling of path extremely hackish! to be improved!!
-        dirname = os.path.dirname(files['summary'])
-        controlfile = os.path.join(dirname, "last.in")
-        lines2 = open(controlfile, "rt").readlines()
-        line2 = lines2.pop()
-        while not line2.startswith("LOCFILES"):
-            line2 = lines2.pop()
-        line2 = line2.split()
-        model = line2[3]
-        model = model.split("/")[-1]
+        # determine which model was used
+        if model is None:
+            dirname = os.path.dirname(files['summary'])
+            model = read_nlloc_control_model(os.path.join(dirname,
+                                                          "last.in"))
 
         catalog = self.catalog
         event = catalog[0]
@@ -2029,8 +2754,9 @@ class ObsPyck(QtGui.QMainWindow):
             event.creation_info.creation_time = UTCDateTime()
         o = Origin()
         event.origins = [o]
-        o.creation_info = CreationInfo(creation_time=creation_time,
-                                       version=nlloc_version)
+        o.creation_info = CreationInfo(
+            creation_time=nlloc_event.signature.creation_time,
+            version=nlloc_event.signature.version)
 
         # assign origin info
         o.method_id = "/".join([ID_ROOT, "location_method", "nlloc", "4"])
@@ -2040,7 +2766,7 @@ class ObsPyck(QtGui.QMainWindow):
         oq = o.quality
         o.longitude = lon
         o.latitude = lat
-        o.depth = depth * (-1e3)  # meters positive down!
+        o.depth = nlloc_event.depth * 1e3  # meters positive down!
         if errY > errX:
             ou.azimuth_max_horizontal_uncertainty = 0
         else:
@@ -2050,153 +2776,63 @@ class ObsPyck(QtGui.QMainWindow):
                 sorted([errX * 1e3, errY * 1e3])
         ou.preferred_description = "uncertainty ellipse"
         o.depth_errors.uncertainty = errZ * 1e3
-        oq.standard_error = rms #XXX stimmt diese Zuordnung!!!?!
-        oq.azimuthal_gap = gap
+        oq.standard_error = nlloc_event.rms #XXX stimmt diese Zuordnung!!!?!
+        oq.azimuthal_gap = nlloc_event.gap
         o.depth_type = "from location"
         o.earth_model_id = "%s/earth_model/%s" % (ID_ROOT, model)
-        o.time = time
-        
-        # goto synthetic phases info lines
-        try:
-            line = lines.pop(0)
-            while not line.startswith("PHASE ID"):
-                line = lines.pop(0)
-        except:
-            err = "Error: No correct synthetic phase info found in NLLoc " + \
-                  "outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
+        o.time = nlloc_event.time
 
-        # remove all non phase-info-lines from bottom of list
-        try:
-            badline = lines.pop()
-            while not badline.startswith("END_PHASE"):
-                badline = lines.pop()
-        except:
-            err = "Error: Could not remove unwanted lines at bottom of " + \
-                  "NLLoc outputfile (%s)!" % files['summary']
-            self.error(err)
-            return
-        
         o.quality.used_phase_count = 0
         o.quality.extra = AttribDict()
         o.quality.extra.usedPhaseCountP = {'value': 0, 'namespace': NAMESPACE}
         o.quality.extra.usedPhaseCountS = {'value': 0, 'namespace': NAMESPACE}
 
-        # go through all phase info lines
-        """
-        Order of fields:
-        ID Ins Cmp On Pha FM Q Date HrMn Sec Coda Amp Per PriorWt > Err ErrMag
-        TTpred Res Weight StaLoc(X Y Z) SDist SAzim RAz RDip RQual Tcorr
-        TTerrTcorr
-        
-        Fields:
-        ID (char*6)
-            station name or code 
-        Ins (char*4)
-            instrument identification for the trace for which the time pick corresponds (i.e. SP, BRB, VBB) 
-        Cmp (char*4)
-            component identification for the trace for which the time pick corresponds (i.e. Z, N, E, H) 
-        On (char*1)
-            description of P phase arrival onset; i, e 
-        Pha (char*6)
-            Phase identification (i.e. P, S, PmP) 
-        FM (char*1)
-            first motion direction of P arrival; c, C, u, U = compression; d, D = dilatation; +, -, Z, N; . or ? = not readable. 
-        Date (yyyymmdd) (int*6)
-            year (with century), month, day 
-        HrMn (hhmm) (int*4)
-            Hour, min 
-        Sec (float*7.4)
-            seconds of phase arrival 
-        Err (char*3)
-            Error/uncertainty type; GAU 
-        ErrMag (expFloat*9.2)
-            Error/uncertainty magnitude in seconds 
-        Coda (expFloat*9.2)
-            coda duration reading 
-        Amp (expFloat*9.2)
-            Maxumim peak-to-peak amplitude 
-        Per (expFloat*9.2)
-            Period of amplitude reading 
-        PriorWt (expFloat*9.2)
-            A-priori phase weight 
-        > (char*1)
-            Required separator between first part (observations) and second part (calculated values) of phase record. 
-        TTpred (float*9.4)
-            Predicted travel time 
-        Res (float*9.4)
-            Residual (observed - predicted arrival time) 
-        Weight (float*9.4)
-            Phase weight (covariance matrix weight for LOCMETH GAU_ANALYTIC, posterior weight for LOCMETH EDT EDT_OT_WT) 
-        StaLoc(X Y Z) (3 * float*9.4)
-            Non-GLOBAL: x, y, z location of station in transformed, rectangular coordinates 
-            GLOBAL: longitude, latitude, z location of station 
-        SDist (float*9.4)
-            Maximum likelihood hypocenter to station epicentral distance in kilometers 
-        SAzim (float*6.2)
-            Maximum likelihood hypocenter to station epicentral azimuth in degrees CW from North 
-        RAz (float*5.1)
-            Ray take-off azimuth at maximum likelihood hypocenter in degrees CW from North 
-        RDip (float*5.1)
-            Ray take-off dip at maximum likelihood hypocenter in degrees upwards from vertical down (0 = down, 180 = up) 
-        RQual (float*5.1)
-            Quality of take-off angle estimation (0 = unreliable, 10 = best) 
-        Tcorr (float*9.4)
-            Time correction (station delay) used for location
-        TTerr (expFloat*9.2)
-            Traveltime error used for location 
-        """
+        picks = self.getEventIndex('picks')
+
         used_stations = set()
-        for line in lines:
-            line = line.split()
+        for phase in nlloc_event.phases:
             # check which type of phase
-            if line[4] == "P":
-                type = "P"
-            elif line[4] == "S":
-                type = "S"
+            if phase.phase in ("P", "S"):
+                type = phase.phase
             else:
                 self.error("Encountered a phase that is not P and not S!! "
                            "This case is not handled yet in reading NLLOC "
                            "output...")
                 continue
-            # get values from line
-            station = line[0]
-            epidist = float(line[21])
-            azimuth = float(line[23])
-            ray_dip = float(line[24])
+            station = phase.station
+            azimuth = phase.ray_azimuth
+            ray_dip = phase.ray_dip
             # if we do the location on traveltime-grids without angle-grids we
             # do not get ray azimuth/incidence. but we can at least use the
             # station to hypocenter azimuth which is very close (~2 deg) to the
             # ray azimuth
             if azimuth == 0.0 and ray_dip == 0.0:
-                azimuth = float(line[22])
+                azimuth = phase.station_azimuth
                 ray_dip = np.nan
-            if line[3] == "I":
+            if phase.onset == "I":
                 onset = "impulsive"
-            elif line[3] == "E":
+            elif phase.onset == "E":
                 onset = "emergent"
             else:
                 onset = None
-            if line[5] == "U":
+            if phase.first_motion == "U":
                 polarity = "positive"
-            elif line[5] == "D":
+            elif phase.first_motion == "D":
                 polarity = "negative"
             else:
                 polarity = None
-            res = float(line[16])
-            weight = float(line[17])
 
             # assign synthetic phase info
-            pick = self.getPick(station=station, phase_hint=type)
+            # first pick of station and phase, like getPick() would find it
+            pick = (picks.lookup('sta', (station, type)) or [None])[0]
             if pick is None:
                 msg = "This should not happen! Location output was read and a corresponding pick is missing!"
                 raise NotImplementedError(msg)
             arrival = Arrival(origin=o, pick=pick)
             # residual is defined as P-Psynth by NLLOC!
-            arrival.distance = kilometer2degrees(epidist)
+            arrival.distance = kilometer2degrees(phase.distance)
             arrival.phase = type
-            arrival.time_residual = res
+            arrival.time_residual = phase.residual
             arrival.azimuth = azimuth
             arrival.takeoff_angle = ray_dip
             if onset and not pick.onset:
@@ -2204,26 +2840,24 @@ class ObsPyck(QtGui.QMainWindow):
             if polarity and not pick.polarity:
                 pick.polarity = polarity
             # we use weights 0,1,2,3 but NLLoc outputs floats...
-            arrival.time_weight = weight
+            arrival.time_weight = phase.weight
             o.quality.used_phase_count += 1
             if type == "P":
                 o.quality.extra.usedPhaseCountP['value'] += 1
-            elif type == "S":
-                o.quality.extra.usedPhaseCountS['value'] += 1
             else:
-                self.error("Phase '%s' not recognized as P or S. " % type +
-                           "Not incrementing P nor S phase count.")
+                o.quality.extra.usedPhaseCountS['value'] += 1
             used_stations.add(station)
         o.used_station_count = len(used_stations)
         self.update_origin_azimuthal_gap()
 
         # read NLLOC scatter file
-        data = readNLLocScatter(PROGRAMS['nlloc']['files']['scatter'],
+        data = readNLLocScatter(files['scatter'],
                                 self.widgets.qPlainTextEdit_stderr)
         o.nonlinloc_scatter = data
 
-    def loadHyp2000Data(self):
-        files = PROGRAMS['hyp_2000']['files']
+    def loadHyp2000Data(self, files=None):
+        if files is None:
+            files = PROGRAMS['hyp_2000']['files']
         lines = open(files['summary'], "rt").readlines()
         if lines == []:
             err = "Error: Hypo2000 output file (%s) does not exist!" % \
@@ -2246,27 +2880,14 @@ class ObsPyck(QtGui.QMainWindow):
             self.error(err)
             return
 
-        year = int(line[1:5])
-        month = int(line[6:8])
-        day = int(line[9:11])
-        hour = int(line[13:15])
-        minute = int(line[15:17])
-        seconds = float(line[18:23])
-        time = UTCDateTime(year, month, day, hour, minute, seconds)
-        lat_deg = int(line[25:27])
-        lat_min = float(line[28:33])
-        lat = lat_deg + (lat_min / 60.)
-        if line[27] == "S":
-            lat = -lat
-        lon_deg = int(line[35:38])
-        lon_min = float(line[39:44])
-        lon = lon_deg + (lon_min / 60.)
-        if line[38] == " ":
-            lon = -lon
-        depth = -float(line[46:51]) # depth: negative down!
-        rms = float(line[52:57])
-        errXY = float(line[58:63])
-        errZ = float(line[64:69])
+        origin = parse_hyp2000_origin(line)
+        time = origin['time']
+        lat = origin['latitude']
+        lon = origin['longitude']
+        depth = -origin['depth'] # depth: negative down!
+        rms = origin['rms']
+        errXY = origin['horizontal_error']
+        errZ = origin['depth_error']
 
         # goto next origin info line
         while True:
@@ -2386,6 +3007,7 @@ class ObsPyck(QtGui.QMainWindow):
 
     def updateNetworkMag(self):
         self.info("updating network magnitude...")
+        self.setCatalogModified()
         event = self.catalog[0]
 
         if not event.origins:
@@ -2481,6 +3103,8 @@ class ObsPyck(QtGui.QMainWindow):
     # XXX TODO maybe rename to "updateStationMagnitude"
     # XXX TODO automatically update magnitude on setting amplitude picks!
     def calculateStationMagnitudes(self):
+        # station magnitudes reference the current amplitude resource_ids
+        commitResourceIDs(self.catalog)
         event = self.catalog[0]
         origin = event.origins[0]
         event.station_magnitudes = []
@@ -2686,14 +3310,10 @@ class ObsPyck(QtGui.QMainWindow):
             if str(event.get("creation_info", {}).get("author", "")).startswith("scevent"):
                 loc = None
             picks = self.getPicks(network=net, station=sta, location=loc)
-            try:
-                arrivals = event.origins[0].arrivals
-            except:
-                arrivals = []
             for pick in picks:
                 if not pick.time:
                     continue
-                arrival = getArrivalForPick(arrivals, pick)
+                arrival = self.getArrivalForPick(pick)
                 self.drawPick(ax, pick, main_axes=True)
                 self.drawPickLabel(ax, pick)
                 if arrival is not None:
@@ -2807,6 +3427,7 @@ class ObsPyck(QtGui.QMainWindow):
         # XXX TODO: this plotting should be based on the contents of the
         # catalog and not on the waveform data
         used_stamags = []
+        stamag_index = self.getEventIndex('station_magnitudes')
         for i, st in enumerate(self.streams):
             # determine which stations are used in location, set color
             net = st[0].stats.network
@@ -2814,8 +3435,8 @@ class ObsPyck(QtGui.QMainWindow):
             coords = st[0].stats.coordinates
             pick_p = self.getPick(network=net, station=sta, phase_hint='P')
             pick_s = self.getPick(network=net, station=sta, phase_hint='S')
-            arrival_p = pick_p and getArrivalForPick(o.arrivals, pick_p)
-            arrival_s = pick_s and getArrivalForPick(o.arrivals, pick_s)
+            arrival_p = pick_p and self.getArrivalForPick(pick_p)
+            arrival_s = pick_s and self.getArrivalForPick(pick_s)
             if (arrival_p and arrival_p.time_residual) or (arrival_s and arrival_s.time_residual):
                 stationColor = 'black'
             else:
@@ -2835,9 +3456,7 @@ class ObsPyck(QtGui.QMainWindow):
                     axEM.text(coords.longitude, coords.latitude, res_info,
                               va='top', family='monospace',
                               color=PHASE_COLORS[pick.phase_hint])
-            for sm in self.catalog[0].station_magnitudes:
-                if sm.waveform_id.station_code != sta:
-                    continue
+            for sm in stamag_index.lookup('sta', sta):
                 used_stamags.append(sm)
                 self.scatterMagIndices.append(i)
                 self.scatterMagLon.append(coords.longitude)
@@ -2994,10 +3613,11 @@ class ObsPyck(QtGui.QMainWindow):
 
         return hypo71_string
 
-    def dicts2hypo71Phases(self):
+    def dicts2hypo71Phases(self, stations=None):
         """
         Returns the pick information in hypo71 phase file format
         as a string. This string can then be written to a file.
+        If `stations` is given, only picks of these stations are used.
 
         Information on the file formats can be found at:
         http://geopubs.wr.usgs.gov/open-file/of02-171/of02-171.pdf p.30
@@ -3058,6 +3678,8 @@ class ObsPyck(QtGui.QMainWindow):
         for st in self.streams:
             net = st[0].stats.network
             sta = st[0].stats.station
+            if stations is not None and sta not in stations:
+                continue
             pick_p = self.getPick(network=net, station=sta, phase_hint='P')
             pick_s = self.getPick(network=net, station=sta, phase_hint='S')
             if not pick_p and not pick_s:
@@ -3141,12 +3763,13 @@ class ObsPyck(QtGui.QMainWindow):
 
         return hypo71_string
     
-    def dicts2NLLocPhases(self):
+    def dicts2NLLocPhases(self, stations=None):
         """
         Returns the pick information in NonLinLoc's own phase
         file format as a string. This string can then be written to a file.
         Currently only those fields really needed in location are actually used
         in assembling the phase information string.
+        If `stations` is given, only picks of these stations are used.
 
         Information on the file formats can be found at:
         http://alomax.free.fr/nlloc/soft6.00/formats.html#_phase_
@@ -3220,6 +3843,9 @@ class ObsPyck(QtGui.QMainWindow):
         nlloc_str = ""
 
         for pick in self.catalog[0].picks:
+            if stations is not None and \
+                    pick.waveform_id.station_code not in stations:
+                continue
             sta = pick.waveform_id.station_code.ljust(6)
             inst = "?".ljust(4)
             comp = "?".ljust(4)
@@ -3253,21 +3879,35 @@ class ObsPyck(QtGui.QMainWindow):
             nlloc_str += phase_str + "\n"
         return nlloc_str
 
+    def setCatalogModified(self):
+        """
+        Marks event data as changed, invalidating the cached QuakeML (see
+        :meth:`get_QUAKEML_string`). As everything runs in the GUI thread,
+        it can be called anywhere in a handler that changes event data.
+        """
+        self.catalogModifications += 1
+
     def get_QUAKEML_string(self):
         """
         Returns all information as xml file (type string)
+
+        The result is cached until event data or the event type/public
+        settings change, so repeated calls without edits cost nothing.
         """
         cat = self.catalog
+        public = self.widgets.qCheckBox_public.isChecked()
+        event_quakeml_type = str(self.widgets.qComboBox_eventType.currentText())
+        key = (id(cat), self.catalogModifications, public, event_quakeml_type)
+        if self.quakemlCache[0] == key:
+            return self.quakemlCache[1]
         cat.creation_info.creation_time = UTCDateTime()
         e = cat[0]
         extra = e.setdefault("extra", AttribDict())
-        public = self.widgets.qCheckBox_public.isChecked()
 
         extra.evaluationMode = {'value': "manual", 'namespace': NAMESPACE}
         extra.public = {'value': public, 'namespace': NAMESPACE}
 
         # check if an quakeML event type should be set
-        event_quakeml_type = str(self.widgets.qComboBox_eventType.currentText())
         if event_quakeml_type != '<event type>':
             e.event_type = event_quakeml_type
         
@@ -3275,12 +3915,8 @@ class ObsPyck(QtGui.QMainWindow):
         # creation and make sure that only wanted arrivals/picks get
         # saved/stored.
 
-        with NamedTemporaryFile() as tf:
-            tmp = tf.name
-            cat.write(tmp, "QUAKEML", nsmap=NSMAP)
-            with open(tmp) as fh:
-                xml = fh.read()
-
+        xml = writeQuakeML(cat, nsmap=NSMAP)
+        self.quakemlCache = (key, xml)
         return xml
     
     def setXMLEventID(self, event_id=None):
@@ -3290,6 +3926,7 @@ class ObsPyck(QtGui.QMainWindow):
             event_id = UTCDateTime().strftime('%Y%m%d%H%M%S')
         self.catalog[0].resource_id = "/".join([ID_ROOT, "event", event_id])
         self.catalog.resource_id = "/".join([ID_ROOT, "catalog", event_id])
+        self.setCatalogModified()
 
     def save_event_locally(self):
         """
@@ -3312,6 +3949,100 @@ class ObsPyck(QtGui.QMainWindow):
         self.critical(msg % name)
         open(name, "wt").write(data)
 
+    def getSession(self):
+        """
+        Returns a dictionary with everything needed to restore the current
+        state: options, raw waveform data with metadata, the catalog (as
+        QuakeML plus obspyck specific amplitude/station magnitude
+        attributes), widget settings, current stream and zoom.
+        """
+        commitResourceIDs(self.catalog)
+        event = self.catalog[0]
+        amplitudes = {}
+        for ampl in event.amplitudes:
+            amplitudes[str(ampl.resource_id)] = (ampl.low, ampl.high,
+                                                 ampl.low_time, ampl.high_time)
+        stamags_used = {}
+        for stamag in event.station_magnitudes:
+            stamags_used[str(stamag.resource_id)] = stamag.get("used", True)
+        widgets = [(name, get_widget_state(getattr(self.widgets, name)))
+                   for name in SESSION_WIDGETS]
+        session = {'options': dict(vars(self.options)),
+                   'streams': streams_to_arrays(self.streams_bkp),
+                   'quakeml': writeQuakeML(self.catalog, nsmap=NSMAP),
+                   'amplitudes': amplitudes,
+                   'station_magnitudes_used': stamags_used,
+                   'focMechCurrent': self.focMechCurrent,
+                   'taup_arrivals': self.taup_arrivals,
+                   'widgets': widgets,
+                   'stPt': self.stPt,
+                   'xlim': tuple(self.axs[0].get_xlim()),
+                   'ylims': [tuple(ax.get_ylim()) for ax in self.axs]}
+        return session
+
+    def saveSession(self):
+        """
+        Save session snapshot to the file given on command line or to a file
+        named after the event in the current directory.
+        """
+        filename = self.options.session
+        if not filename:
+            name = str(self.catalog[0].resource_id).split("/")[-1]
+            filename = "obspyck_%s.session" % name
+        self.info("creating session snapshot...")
+        save_session(filename, self.getSession())
+        self.critical("wrote session as %s" % filename)
+
+    def restoreSession(self, session):
+        """
+        Restores event data and view settings from a session dictionary (see
+        :meth:`getSession`). Waveforms and options of the session have to be
+        used to set up ObsPyck beforehand.
+        """
+        self.catalog = readQuakeML(StringIO(session['quakeml']))
+        self.setCatalogModified()
+        self.update_qml_text(session['quakeml'])
+        event = self.catalog[0]
+        for ampl in event.amplitudes:
+            values = session['amplitudes'].get(str(ampl.resource_id))
+            if values is None:
+                continue
+            resource_id = ampl.resource_id
+            ampl.low, ampl.high, ampl.low_time, ampl.high_time = values
+            # setting attributes marks amplitudes as changed, resetting the
+            # resource_id keeps the one referenced by station magnitudes
+            ampl.resource_id = resource_id
+        for stamag in event.station_magnitudes:
+            stamag.used = session['station_magnitudes_used'].get(
+                str(stamag.resource_id), True)
+        self.focMechCurrent = session['focMechCurrent']
+        # sessions of older versions lack the theoretical arrivals
+        self.taup_arrivals = session.get('taup_arrivals', {})
+        # set all widgets first and redraw only once afterwards
+        for name, value in session['widgets']:
+            widget = getattr(self.widgets, name)
+            widget.blockSignals(True)
+            set_widget_state(widget, value)
+            widget.blockSignals(False)
+        self.stPt = session['stPt']
+        combobox = self.widgets.qComboBox_streamName
+        combobox.blockSignals(True)
+        combobox.setCurrentIndex(self.stPt)
+        combobox.blockSignals(False)
+        self.touchCurrentStream()
+        self.streams[self.stPt] = stream_view(self.streams_bkp[self.stPt])
+        if self.widgets.qToolButton_spectrogram.isChecked():
+            self.on_qToolButton_spectrogram_toggled()
+        else:
+            self.drawStream()
+        self.updateStreamNumberLabel()
+        for ax, ylim in zip(self.axs, session['ylims']):
+            ax.set_ylim(ylim)
+        self.axs[0].set_xlim(session['xlim'])
+        self.redraw()
+        self.critical("Restored session (%i streams, %i picks)" % (
+            self.stNum, len(event.picks)))
+
     def uploadSeisHub(self):
         """
         Upload quakeml file to SeisHub
@@ -3407,23 +4138,31 @@ class ObsPyck(QtGui.QMainWindow):
 
     def clearEvent(self):
         self.info("Clearing previous event data.")
+        self.clearNLLocComparison()
         self.catalog = Catalog()
         event = Event()
         event.set_creation_info(self.username)
         self.catalog.events = [event]
+        self.setCatalogModified()
 
     def clearOriginMagnitude(self):
         self.info("Clearing previous origin and magnitude data.")
+        self.setCatalogModified()
         self.catalog[0].origins = [Origin()]
         self.catalog[0].magnitudes = []
         self.catalog[0].station_magnitudes = []
 
     def clearFocmec(self):
         self.info("Clearing previous focal mechanism data.")
+        self.setCatalogModified()
         self.catalog[0].focal_mechanisms = []
         self.focMechCount = None
 
     def updateAllItems(self):
+        # redraw after a user action: changed picks/amplitudes get their new
+        # resource_ids now
+        commitResourceIDs(self.catalog)
+        self.setCatalogModified()
         st = self.getCurrentStream()
         event = self.catalog[0]
         ids = []
@@ -3446,14 +4185,10 @@ class ObsPyck(QtGui.QMainWindow):
         if event.get("creation_info", {}).get("author", "").startswith("scevent"):
             loc = None
         picks = self.getPicks(network=net, station=sta, location=loc)
-        try:
-            arrivals = event.origins[0].arrivals
-        except:
-            arrivals = []
         for pick in picks:
             if not pick.time:
                 continue
-            arrival = getArrivalForPick(arrivals, pick)
+            arrival = self.getArrivalForPick(pick)
             # do drawing in all axes
             for _id, ax in zip(ids, self.axs):
                 self.debug(str(pick))
@@ -3472,6 +4207,9 @@ class ObsPyck(QtGui.QMainWindow):
                     break
             else:
                 self.drawPickLabel(self.axs[-1], pick, main_axes=False)
+        # plot theoretical arrivals of catalog events
+        for tt in self.taup_arrivals.get(sta, []):
+            self.drawTheoreticalArrival(tt)
         # plot amplitudes
         if self.widgets.qToolButton_spectrogram.isChecked():
             pass
@@ -3555,6 +4293,35 @@ class ObsPyck(QtGui.QMainWindow):
         if main_axes:
             ax.axvspan(time, reltime, color=color, alpha=0.2)
 
+    def drawTheoreticalArrival(self, tt):
+        """
+        Draws a theoretical arrival of a catalog event (see
+        :func:`get_event_info`) into all axes.
+        """
+        reltime = self.time_abs2rel(tt['time'])
+        for ax in self.axs:
+            ax.axvline(reltime, color="gray", linestyle=":",
+                       linewidth=AXVLINEWIDTH, ymin=0, ymax=1,
+                       gid="theoretical_arrival")
+        ax = self.axs[0]
+        ax.text(reltime, 0.02, " " + tt['phase_name'],
+                transform=self.trans[0], color="gray",
+                family='monospace', va="bottom", gid="theoretical_arrival")
+
+    def redrawTheoreticalArrivals(self):
+        """
+        Replaces only the theoretical arrivals drawn for the current station,
+        picks and amplitudes are left as they are.
+        """
+        for ax in self.axs:
+            ax.lines = [line for line in ax.lines
+                        if line.get_gid() != "theoretical_arrival"]
+            ax.texts = [text for text in ax.texts
+                        if text.get_gid() != "theoretical_arrival"]
+        sta = self.getCurrentStream()[0].stats.station
+        for tt in self.taup_arrivals.get(sta, []):
+            self.drawTheoreticalArrival(tt)
+
     def drawAmplitude(self, ax, amplitude, scaling=None, main_axes=True):
         if main_axes:
             color = PHASE_COLORS['Mag']
@@ -3581,13 +4348,17 @@ class ObsPyck(QtGui.QMainWindow):
 
     def delPick(self, pick):
         event = self.catalog[0]
+        index = self.getEventIndex('picks')
         if pick in event.picks:
             event.picks.remove(pick)
+            index.remove(pick)
 
     def delAmplitude(self, amplitude):
         event = self.catalog[0]
+        index = self.getEventIndex('amplitudes')
         if amplitude in event.amplitudes:
             event.amplitudes.remove(amplitude)
+            index.remove(amplitude)
 
     def getPick(self, network=None, station=None, phase_hint=None, waveform_id=None, axes=None, setdefault=False, seed_string=None):
         """
@@ -3595,7 +4366,26 @@ class ObsPyck(QtGui.QMainWindow):
         if setdefault is True then if no pick is found an empty one is returned and inserted into self.picks.
         """
         picks = self.catalog[0].picks
-        for p in picks:
+        index = self.getEventIndex('picks')
+        # narrow down the picks to check using the index, all criteria are
+        # still checked below
+        if axes is not None:
+            _i = self.axs.index(axes)
+            candidates = index.lookup('seed', (self.getCurrentStream()[_i].id,
+                                               self.getCurrentPhase()))
+        elif seed_string is not None and phase_hint is not None:
+            candidates = index.lookup('seed', (seed_string, phase_hint))
+        elif waveform_id is not None and phase_hint is not None:
+            candidates = index.lookup('seed', (waveform_id.getSEEDString(),
+                                               phase_hint))
+        elif network is not None and station is not None and \
+                phase_hint is not None:
+            candidates = index.lookup('netsta', (network, station, phase_hint))
+        elif station is not None and phase_hint is not None:
+            candidates = index.lookup('sta', (station, phase_hint))
+        else:
+            candidates = picks
+        for p in candidates:
             if network is not None and network != p.waveform_id.network_code:
                 continue
             if station is not None and station != p.waveform_id.station_code:
@@ -3625,10 +4415,68 @@ class ObsPyck(QtGui.QMainWindow):
                 raise Exception("Pick setdefault needs seed_string and phase_hint kwargs")
             p = Pick(seed_string=seed_string, phase_hint=phase_hint)
             picks.append(p)
+            index.add(p)
             return p
         else:
             return None
 
+    def getEventIndex(self, name):
+        """
+        Returns the hash index on the picks, amplitudes or station magnitudes
+        (`name`) of the current event. Picks/amplitudes have to be
+        added/removed via getPick/getAmplitude(setdefault=True), setPick,
+        delPick and delAmplitude to keep it up to date. If the list was
+        replaced (e.g. new event loaded, station magnitudes recalculated)
+        or changed otherwise, the index gets rebuilt.
+        """
+        items = getattr(self.catalog[0], name)
+        index = self.eventIndexes[name]
+        if not index.is_valid(items):
+            index.rebuild(items)
+        return index
+
+    def getArrivalIndex(self):
+        """
+        Returns the hash index on the arrivals of the current origin. It
+        gets rebuilt when the arrivals changed (e.g. after a relocation).
+        """
+        try:
+            arrivals = self.catalog[0].origins[0].arrivals
+        except IndexError:
+            arrivals = []
+        if not self.arrivalIndex.is_valid(arrivals):
+            self.arrivalIndex.rebuild(arrivals)
+        return self.arrivalIndex
+
+    def getArrivalForPick(self, pick):
+        """
+        Returns the arrival of the current origin that references the given
+        pick (None if there is none).
+        """
+        # a changed pick is not the version arrivals reference, it gets a new
+        # resource_id at the next commit point (see commitResourceIDs())
+        if pick is None or pick.isModified():
+            return None
+        arrivals = self.getArrivalIndex().lookup('pick_id',
+                                                 str(pick.resource_id))
+        if arrivals:
+            return arrivals[0]
+        return None
+
+    def getPickForArrival(self, arrival):
+        """
+        Returns the pick of the current event that is referenced by the given
+        arrival (None if there is none).
+        """
+        if arrival.pick_id is None:
+            return None
+        picks = self.getEventIndex('picks').lookup('resource_id',
+                                                   str(arrival.pick_id))
+        # a changed pick is not the version the arrival references
+        if picks and not picks[0].isModified():
+            return picks[0]
+        return None
+
     def getPicks(self, network, station, location):
         """
         returns all matching picks as list.
@@ -3651,7 +4499,21 @@ class ObsPyck(QtGui.QMainWindow):
         if setdefault is True then if no arrival is found an empty one is returned and inserted into self.arrivals.
         """
         amplitudes = self.catalog[0].amplitudes
-        for a in amplitudes:
+        index = self.getEventIndex('amplitudes')
+        # narrow down the amplitudes to check using the index, all criteria
+        # are still checked below
+        if axes is not None:
+            _i = self.axs.index(axes)
+            candidates = index.lookup('seed', self.getCurrentStream()[_i].id)
+        elif seed_string is not None:
+            candidates = index.lookup('seed', seed_string)
+        elif waveform_id is not None:
+            candidates = index.lookup('seed', waveform_id.getSEEDString())
+        elif network is not None and station is not None:
+            candidates = index.lookup('netsta', (network, station))
+        else:
+            candidates = amplitudes
+        for a in candidates:
             if network is not None and network != a.waveform_id.network_code:
                 continue
             if station is not None and station != a.waveform_id.station_code:
@@ -3677,6 +4539,7 @@ class ObsPyck(QtGui.QMainWindow):
             self.debug(seed_string)
             a = Amplitude(seed_string=seed_string)
             amplitudes.append(a)
+            index.add(a)
             return a
         else:
             return None
@@ -3685,27 +4548,18 @@ class ObsPyck(QtGui.QMainWindow):
         """
         returns all matching amplitudes as list.
         """
-        amplitudes = self.catalog[0].amplitudes
-        ret = []
-        for a in amplitudes:
-            if network != a.waveform_id.network_code:
-                continue
-            if station != a.waveform_id.station_code:
-                continue
-            if location != a.waveform_id.location_code:
-                continue
-            ret.append(a)
-        return ret
+        index = self.getEventIndex('amplitudes')
+        return list(index.lookup('netstaloc', (network, station, location)))
 
     def getTrace(self, seed_string):
         """
         returns matching trace, does NOT ensure there is only one!
         """
         network, station, location, channel = seed_string.split(".")
-        st = self.getStream(network, station, location)
-        if st is None:
+        i = self.streamIndex.get((network, station, location))
+        if i is None:
             return None
-        st = st.select(channel=channel)
+        st = self.getTraceIndex(i).get(channel, [])
         if len(st) > 1:
             err = ("Warning: More than one trace matching. "
                    "This should not happen.")
@@ -3715,10 +4569,32 @@ class ObsPyck(QtGui.QMainWindow):
         else:
             return None
 
+    def getTraceIndex(self, i):
+        """
+        Returns a dictionary mapping channel codes to traces of the stream at
+        given position. It is only rebuilt if the stream was replaced (e.g.
+        filtered/rotated) or its traces or channel codes changed.
+        """
+        st = self.streams[i]
+        key = tuple((id(tr), tr.stats.channel) for tr in st)
+        cached = self.traceIndex.get(i)
+        if cached is None or cached[0] != key:
+            traces = {}
+            for tr in st:
+                traces.setdefault(tr.stats.channel, []).append(tr)
+            cached = (key, traces)
+            self.traceIndex[i] = cached
+        return cached[1]
+
     def getStream(self, network=None, station=None, location=None):
         """
         returns matching stream, does NOT ensure there is only one!
         """
+        if None not in (network, station, location):
+            i = self.streamIndex.get((network, station, location))
+            if i is None:
+                return None
+            return self.streams[i]
         streams = self.streams
         for st in streams:
             if network is not None and network != st[0].stats.network:
@@ -3735,27 +4611,20 @@ class ObsPyck(QtGui.QMainWindow):
         returns matching station magnitude, does NOT ensure there is only one!
         """
         try:
-            stamags = self.catalog[0].station_magnitudes
+            index = self.getEventIndex('station_magnitudes')
         except:
             return None
-        for stamag in stamags:
-            wid = stamag.waveform_id
-            if network != wid.network_code:
-                continue
-            if station != wid.station_code:
-                continue
-            if location != wid.location_code:
-                continue
-            return stamag
+        stamags = index.lookup('netstaloc', (network, station, location))
+        if stamags:
+            return stamags[0]
         return None
 
     def update_origin_azimuthal_gap(self):
         origin = self.catalog[0].origins[0]
         arrivals = origin.arrivals
-        picks = self.catalog[0].picks
         azims = {}
         for a in arrivals:
-            p = getPickForArrival(picks, a)
+            p = self.getPickForArrival(a)
             if p is None:
                 msg = ("Could not find pick for arrival. Aborting calculation "
                        "of azimuthal gap.")
@@ -3811,29 +4680,43 @@ class ObsPyck(QtGui.QMainWindow):
         XXX should be called when fetching an event.
         """
         picks = self.catalog[0].picks
-        _ids = [p.waveform_id for p in picks]
-        _phase_hints = [p.phase_hint for p in picks]
         msg = "For picks, any waveform_id / phase_hint combination must " + \
               "be unique. Some non-unique picks were removed:"
-        for _id in _ids:
-            for _phase_hint in _phase_hints:
-                picks = [p for p in picks
-                         if p.phase_hint == _phase_hint
-                         and p.waveform_id == _id]
-                if len(picks) > 1:
-                    self.critical(msg)
-                    for p in picks[1:]:
-                        self.critical(str(p))
-                        self.catalog[0].picks.remove(p)
+        # one pass over all picks, grouping duplicates by combination in
+        # order of first occurence
+        keep = []
+        duplicates = {}
+        order = []
+        for p in picks:
+            wid = p.waveform_id
+            key = (wid.network_code, wid.station_code, wid.location_code,
+                   wid.channel_code, str(wid.resource_uri), p.phase_hint)
+            if key in duplicates:
+                duplicates[key].append(p)
+                continue
+            duplicates[key] = []
+            order.append(key)
+            keep.append(p)
+        if len(keep) == len(picks):
+            return
+        for key in order:
+            if duplicates[key]:
+                self.critical(msg)
+                for p in duplicates[key]:
+                    self.critical(str(p))
+        picks[:] = keep
 
     def setPick(self, pick):
         """
         Replace stored pick with given pick object.
         """
         picks = self.catalog[0].picks
+        index = self.getEventIndex('picks')
         old = self.getPick(waveform_id=pick.waveform_id, phase_hint=pick.phase_hint)
         picks.remove(old)
+        index.remove(old)
         picks.append(pick)
+        index.add(pick)
 
     def getEventFromSeisHub(self, resource_name):
         """
@@ -3844,6 +4727,7 @@ class ObsPyck(QtGui.QMainWindow):
 
         # parse quakeml
         self.catalog = readQuakeML(StringIO(resource_xml))
+        self.setCatalogModified()
         self.update_qml_text(resource_xml)
         ev = self.catalog[0]
 
@@ -4032,8 +4916,17 @@ def main():
         for key, value in KEYS.iteritems():
             print "%s: \"%s\"" % (key, value)
         return
+    session = None
+    if options.session and os.path.isfile(options.session):
+        filename = options.session
+        session = load_session(filename)
+        # sessions of older versions lack newer options, use their defaults
+        options = parser.get_default_values()
+        for key, value in session['options'].iteritems():
+            setattr(options, key, value)
+        options.session = filename
     # check for necessary options
-    if not any([getattr(parser.values, parser.get_option(opt).dest) \
+    elif not any([getattr(parser.values, parser.get_option(opt).dest) \
                 for opt in ("--seishub-ids", "--arclink-ids", "-f")]) \
        or not all([getattr(parser.values, parser.get_option(opt).dest) \
                    for opt in ('-d', '-t')]):
@@ -4046,10 +4939,26 @@ def main():
     #    IPython.Shell.IPShellEmbed(['-pdb'],
     #            banner='Entering IPython.  Press Ctrl-D to exit.',
     #            exit_msg='Leaving Interpreter, back to program.')()
-    (clients, streams) = fetch_waveforms_with_metadata(options)
+    if session is not None:
+        print "Restoring session: %s" % options.session
+        streams = arrays_to_streams(session['streams'])
+        clients = create_clients(options)
+        cleaned = True
+    else:
+        streams = None
+        if options.waveform_store:
+            streams = load_streams(options.waveform_store, options)
+        if streams is None:
+            (clients, streams) = fetch_waveforms_with_metadata(options)
+            cleaned = False
+        else:
+            print "Using waveform store: %s" % options.waveform_store
+            clients = create_clients(options)
+            cleaned = True
     # Create the GUI application
     qApp = QtGui.QApplication(sys.argv)
-    obspyck = ObsPyck(clients, streams, options, KEYS)
+    obspyck = ObsPyck(clients, streams, options, KEYS, cleaned=cleaned,
+                      session=session)
     qApp.connect(qApp, QtCore.SIGNAL("aboutToQuit()"), obspyck.cleanup)
     os._exit(qApp.exec_())
 
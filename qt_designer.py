@@ -143,6 +143,33 @@ class Ui_qMainWindow_obsPyck(object):
         self.qComboBox_nllocModel.addItem(_fromUtf8(""))
         self.horizontalLayout_3.addWidget(self.qComboBox_nllocModel)
         self.leftVerticalLayout.addLayout(self.horizontalLayout_3)
+        self.qToolButton_doGridSearch = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_doGridSearch.sizePolicy().hasHeightForWidth())
+        self.qToolButton_doGridSearch.setSizePolicy(sizePolicy)
+        self.qToolButton_doGridSearch.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_doGridSearch.setObjectName(_fromUtf8("qToolButton_doGridSearch"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_doGridSearch)
+        self.qToolButton_compareNlloc = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_compareNlloc.sizePolicy().hasHeightForWidth())
+        self.qToolButton_compareNlloc.setSizePolicy(sizePolicy)
+        self.qToolButton_compareNlloc.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_compareNlloc.setObjectName(_fromUtf8("qToolButton_compareNlloc"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_compareNlloc)
+        self.qToolButton_resampleLocation = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_resampleLocation.sizePolicy().hasHeightForWidth())
+        self.qToolButton_resampleLocation.setSizePolicy(sizePolicy)
+        self.qToolButton_resampleLocation.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_resampleLocation.setObjectName(_fromUtf8("qToolButton_resampleLocation"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_resampleLocation)
         self.qToolButton_doFocMec = QtGui.QToolButton(self.layoutWidgetxx)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
         sizePolicy.setHorizontalStretch(0)
@@ -152,6 +179,16 @@ class Ui_qMainWindow_obsPyck(object):
         self.qToolButton_doFocMec.setFocusPolicy(QtCore.Qt.NoFocus)
         self.qToolButton_doFocMec.setObjectName(_fromUtf8("qToolButton_doFocMec"))
         self.leftVerticalLayout.addWidget(self.qToolButton_doFocMec)
+        self.qToolButton_cancelLocator = QtGui.QToolButton(self.layoutWidgetxx)
+        self.qToolButton_cancelLocator.setEnabled(False)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_cancelLocator.sizePolicy().hasHeightForWidth())
+        self.qToolButton_cancelLocator.setSizePolicy(sizePolicy)
+        self.qToolButton_cancelLocator.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_cancelLocator.setObjectName(_fromUtf8("qToolButton_cancelLocator"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_cancelLocator)
         spacerItem1 = QtGui.QSpacerItem(201, 13, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
         self.leftVerticalLayout.addItem(spacerItem1)
         self.qToolButton_showMap = QtGui.QToolButton(self.layoutWidgetxx)
@@ -249,6 +286,15 @@ class Ui_qMainWindow_obsPyck(object):
         self.qToolButton_saveEventLocally.setFocusPolicy(QtCore.Qt.NoFocus)
         self.qToolButton_saveEventLocally.setObjectName(_fromUtf8("qToolButton_saveEventLocally"))
         self.leftVerticalLayout.addWidget(self.qToolButton_saveEventLocally)
+        self.qToolButton_saveSession = QtGui.QToolButton(self.layoutWidgetxx)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.qToolButton_saveSession.sizePolicy().hasHeightForWidth())
+        self.qToolButton_saveSession.setSizePolicy(sizePolicy)
+        self.qToolButton_saveSession.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.qToolButton_saveSession.setObjectName(_fromUtf8("qToolButton_saveSession"))
+        self.leftVerticalLayout.addWidget(self.qToolButton_saveSession)
         self.horizontalLayout_4 = QtGui.QHBoxLayout()
         self.horizontalLayout_4.setSizeConstraint(QtGui.QLayout.SetMinimumSize)
         self.horizontalLayout_4.setObjectName(_fromUtf8("horizontalLayout_4"))
@@ -773,7 +819,11 @@ class Ui_qMainWindow_obsPyck(object):
         self.qComboBox_nllocModel.setItemText(0, QtGui.QApplication.translate("qMainWindow_obsPyck", "BY", None, QtGui.QApplication.UnicodeUTF8))
         self.qComboBox_nllocModel.setItemText(1, QtGui.QApplication.translate("qMainWindow_obsPyck", "RH", None, QtGui.QApplication.UnicodeUTF8))
         self.qComboBox_nllocModel.setItemText(2, QtGui.QApplication.translate("qMainWindow_obsPyck", "UH", None, QtGui.QApplication.UnicodeUTF8))
+        self.qToolButton_doGridSearch.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "do grid search", None, QtGui.QApplication.UnicodeUTF8))
+        self.qToolButton_compareNlloc.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "compare NLLoc models", None, QtGui.QApplication.UnicodeUTF8))
+        self.qToolButton_resampleLocation.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "resample location", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_doFocMec.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "do focmec", None, QtGui.QApplication.UnicodeUTF8))
+        self.qToolButton_cancelLocator.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "cancel", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_showMap.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "show Map", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_showFocMec.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "show FocMec", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_nextFocMec.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "next FocMec", None, QtGui.QApplication.UnicodeUTF8))
@@ -784,6 +834,7 @@ class Ui_qMainWindow_obsPyck(object):
         self.qToolButton_replaceEvent.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "replace Event", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_deleteEvent.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "delete Event", None, QtGui.QApplication.UnicodeUTF8))
         self.qToolButton_saveEventLocally.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "save Event locally", None, QtGui.QApplication.UnicodeUTF8))
+        self.qToolButton_saveSession.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "save Session", None, QtGui.QApplication.UnicodeUTF8))
         self.qCheckBox_public.setText(QtGui.QApplication.translate("qMainWindow_obsPyck", "public", None, QtGui.QApplication.UnicodeUTF8))
         self.qComboBox_eventType.setItemText(0, QtGui.QApplication.translate("qMainWindow_obsPyck", "<event type>", None, QtGui.QApplication.UnicodeUTF8))
         self.qComboBox_eventType.setItemText(1, QtGui.QApplication.translate("qMainWindow_obsPyck", "earthquake", None, QtGui.QApplication.UnicodeUTF8))
@@ -0,0 +1,156 @@
+import json
+import zipfile
+from StringIO import StringIO
+
+import numpy as np
+from PyQt4 import QtGui
+from obspy import Stream, Trace
+
+from waveform_store import encode_json_object, decode_json_object, \
+    DERIVED_STATS
+
+SESSION_VERSION = 2
+# a session file is a zip archive (like .npz) with the event as QuakeML, the
+# trace data as .npy files and everything else in a JSON header. Nothing is
+# unpickled, so session files from others can be opened safely.
+SESSION_HEADER_FILENAME = "session.json"
+SESSION_QUAKEML_FILENAME = "event.xml"
+# widgets holding processing/display settings that are stored in a session
+# (in the order they get restored)
+SESSION_WIDGETS = ("qComboBox_filterType", "qCheckBox_zerophase",
+        "qCheckBox_50Hz", "qDoubleSpinBox_corners", "qDoubleSpinBox_highpass",
+        "qDoubleSpinBox_lowpass", "qDoubleSpinBox_sta", "qDoubleSpinBox_lta",
+        "qDoubleSpinBox_wlen", "qDoubleSpinBox_perlap",
+        "qCheckBox_spectrogramLog", "qToolButton_filter",
+        "qToolButton_rotateLQT", "qToolButton_rotateZRT",
+        "qToolButton_trigger", "qToolButton_spectrogram",
+        "qComboBox_phaseType", "qComboBox_eventType", "qCheckBox_public")
+
+
+def get_widget_state(widget):
+    """
+    Returns the state of a combobox (current text), spinbox (value) or
+    checkable button/checkbox.
+    """
+    if isinstance(widget, QtGui.QComboBox):
+        return unicode(widget.currentText())
+    if isinstance(widget, QtGui.QDoubleSpinBox):
+        return widget.value()
+    return widget.isChecked()
+
+
+def set_widget_state(widget, value):
+    """
+    Sets a state as returned by :func:`get_widget_state`. Texts missing in
+    comboboxes (e.g. custom event types) get added.
+    """
+    if isinstance(widget, QtGui.QComboBox):
+        index = widget.findText(value)
+        if index == -1:
+            widget.addItem(value)
+            index = widget.findText(value)
+        widget.setCurrentIndex(index)
+    elif isinstance(widget, QtGui.QDoubleSpinBox):
+        widget.setValue(value)
+    else:
+        widget.setChecked(value)
+
+
+def streams_to_arrays(streams):
+    """
+    Converts streams to lists of (stats, data, mask) tuples with plain
+    numpy arrays (memory-mapped data gets read) for saving.
+    """
+    ret = []
+    for st in streams:
+        traces = []
+        for tr in st:
+            mask = None
+            if np.ma.isMaskedArray(tr.data):
+                mask = np.ma.getmaskarray(tr.data)
+            traces.append((tr.stats, np.asarray(np.ma.getdata(tr.data)),
+                           mask))
+        ret.append(traces)
+    return ret
+
+
+def arrays_to_streams(arrays):
+    """
+    Inverse of :func:`streams_to_arrays`.
+    """
+    streams = []
+    for traces in arrays:
+        st = Stream()
+        for stats, data, mask in traces:
+            if mask is not None:
+                data = np.ma.masked_array(data, mask=mask)
+            st.append(Trace(data=data, header=stats))
+        streams.append(st)
+    return streams
+
+
+def _write_array(zip_, name, array):
+    buf = StringIO()
+    np.save(buf, array, allow_pickle=False)
+    zip_.writestr(name, buf.getvalue())
+
+
+def _read_array(zip_, name):
+    return np.load(StringIO(zip_.read(name)), allow_pickle=False)
+
+
+def save_session(filename, session):
+    """
+    Writes a session dictionary (see :meth:`ObsPyck.getSession`) to a file,
+    see :data:`SESSION_HEADER_FILENAME`.
+    """
+    header = dict(session, version=SESSION_VERSION, streams=[])
+    quakeml = header.pop('quakeml')
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED) as zip_:
+        zip_.writestr(SESSION_QUAKEML_FILENAME, quakeml)
+        for i, traces in enumerate(session['streams']):
+            items = []
+            for j, (stats, data, mask) in enumerate(traces):
+                item = {'data': "%i_%i.npy" % (i, j)}
+                _write_array(zip_, item['data'], data)
+                if mask is not None:
+                    item['mask'] = "%i_%i_mask.npy" % (i, j)
+                    _write_array(zip_, item['mask'], mask)
+                item['stats'] = dict((key, value)
+                                     for key, value in stats.iteritems()
+                                     if key not in DERIVED_STATS)
+                items.append(item)
+            header['streams'].append(items)
+        zip_.writestr(SESSION_HEADER_FILENAME,
+                      json.dumps(header, default=encode_json_object))
+
+
+def load_session(filename):
+    """
+    Reads a session dictionary written with :func:`save_session`.
+    """
+    try:
+        with zipfile.ZipFile(filename, "r") as zip_:
+            session = json.loads(zip_.read(SESSION_HEADER_FILENAME),
+                                 object_hook=decode_json_object)
+            if session.get("version") != SESSION_VERSION:
+                msg = "Unsupported session file version: %s" % \
+                    session.get("version")
+                raise ValueError(msg)
+            session['quakeml'] = zip_.read(SESSION_QUAKEML_FILENAME)
+            streams = []
+            for items in session['streams']:
+                traces = []
+                for item in items:
+                    mask = None
+                    if "mask" in item:
+                        mask = _read_array(zip_, item.mask)
+                    traces.append((item.stats, _read_array(zip_, item.data),
+                                   mask))
+                streams.append(traces)
+            session['streams'] = streams
+    # sessions of older versions were pickled and are not read anymore
+    except (zipfile.BadZipfile, KeyError) as e:
+        msg = "Not a valid session file: %s (%s)" % (filename, str(e))
+        raise ValueError(msg)
+    return session
@@ -0,0 +1,206 @@
+import math
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from matplotlib.colors import Normalize
+from obspy.signal.util import nearestPow2
+
+# returned by SpectrogramCache.get() for spectrograms that could not be
+# computed
+FAILED = object()
+
+
+def compute_spectrogram(data, samp_rate, wlen=None, per_lap=0.9, mult=8.0,
+                        max_columns=None, chunksize=256):
+    """
+    Computes the spectrogram of given data with the same windowing and
+    scaling as :func:`obspy.imaging.spectrogram.spectrogram` (which uses
+    :func:`matplotlib.mlab.specgram`), but only returns the arrays instead of
+    plotting them.
+
+    Data is processed in single precision, windows are strided views on the
+    data (no copy per window) and real FFTs are used. If `max_columns` is
+    given, the window step is increased so that at most that many time
+    columns are computed (e.g. the pixel width of the axes the spectrogram
+    is shown in), which keeps long, high sampling rate traces fast.
+
+    :returns: (specgram, freq, time) with the amplitude spectrogram (zero
+        frequency removed), frequencies and window center times in seconds
+        relative to the first sample.
+    """
+    samp_rate = float(samp_rate)
+    if not wlen:
+        wlen = samp_rate / 100.
+    npts = len(data)
+    nfft = int(nearestPow2(wlen * samp_rate))
+    if nfft > npts:
+        nfft = int(nearestPow2(npts / 8.0))
+    pad_to = nfft
+    if mult is not None:
+        pad_to = int(nearestPow2(mult)) * nfft
+    nlap = int(nfft * float(per_lap))
+    step = max(nfft - nlap, 1)
+    ncols = (npts - nfft) // step + 1
+    if max_columns and ncols > max_columns > 1:
+        step = int(math.ceil((npts - nfft) / float(max_columns - 1)))
+        ncols = (npts - nfft) // step + 1
+
+    if np.ma.isMaskedArray(data):
+        data = data.filled(data.mean())
+    data = np.require(data, dtype=np.float32)
+    data = np.ascontiguousarray(data - data.mean(), dtype=np.float32)
+    itemsize = data.strides[0]
+    windows = as_strided(data, shape=(ncols, nfft),
+                         strides=(step * itemsize, itemsize))
+    window = np.hanning(nfft).astype(np.float32)
+    nfreq = pad_to // 2 + 1
+    specgram = np.empty((nfreq, ncols), dtype=np.float32)
+    # work on blocks of windows to limit memory usage of temporary arrays
+    for i in range(0, ncols, chunksize):
+        block = np.fft.rfft(windows[i:i + chunksize] * window, n=pad_to,
+                            axis=1)
+        power = block.real ** 2
+        power += block.imag ** 2
+        specgram[:, i:i + chunksize] = power.T
+    # scale to power spectral density like mlab.specgram does
+    specgram /= samp_rate * (window.astype(np.float64) ** 2).sum()
+    if pad_to % 2:
+        specgram[1:] *= 2
+    else:
+        specgram[1:-1] *= 2
+    freq = np.arange(nfreq) * samp_rate / pad_to
+    time = (np.arange(ncols) * step + nfft / 2.0) / samp_rate
+    specgram = np.sqrt(specgram[1:, :])
+    freq = freq[1:]
+    return specgram, freq, time
+
+
+def plot_spectrogram(ax, specgram, freq, time, log=False, cmap=None,
+                     zorder=None, offset=0.0):
+    """
+    Plots a spectrogram as returned by :func:`compute_spectrogram` into given
+    axes. Only the plotting depends on the `log` option, so toggling it does
+    not need a recomputation of the spectrogram.
+
+    :type offset: float
+    :param offset: Time of the first sample on the time axis of the plot.
+    """
+    norm = Normalize(specgram.min(), specgram.max(), clip=True)
+    halfbin_time = (time[1] - time[0]) / 2.0 if len(time) > 1 else 0.5
+    halfbin_freq = (freq[1] - freq[0]) / 2.0
+    time = time + offset
+    if log:
+        # pcolor expects one bin more at the right end
+        freq = np.concatenate((freq, [freq[-1] + 2 * halfbin_freq]))
+        time = np.concatenate((time, [time[-1] + 2 * halfbin_time]))
+        # center bin
+        time -= halfbin_time
+        freq -= halfbin_freq
+        ax.set_yscale('log')
+        ax.pcolormesh(time, freq, specgram, cmap=cmap, zorder=zorder,
+                      norm=norm)
+    else:
+        # this method is much much faster!
+        extent = (time[0] - halfbin_time, time[-1] + halfbin_time,
+                  freq[0] - halfbin_freq, freq[-1] + halfbin_freq)
+        ax.imshow(np.flipud(specgram), interpolation="nearest",
+                  extent=extent, cmap=cmap, zorder=zorder, norm=norm)
+    ax.axis('tight')
+    ax.grid(False)
+
+
+class SpectrogramCache(object):
+    """
+    Computes spectrograms in a pool of worker threads and keeps the results
+    keyed by trace and spectrogram parameters, so that switching back and
+    forth between streams or plotting options does not compute them again.
+    """
+    def __init__(self, processes=2, maxsize=30):
+        self.pool = ThreadPool(processes)
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.pending = set()
+        self.failed = set()
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _key(self, tr, wlen, per_lap, max_columns, tag):
+        return (tr.id, str(tr.stats.starttime), tr.stats.npts,
+                float(tr.stats.sampling_rate), float(wlen), float(per_lap),
+                max_columns, tag)
+
+    def get(self, tr, wlen, per_lap, max_columns=None, tag=None):
+        """
+        Returns the cached spectrogram (see :func:`compute_spectrogram`) for
+        given trace, None if it is not available yet or :data:`FAILED` if
+        its computation failed. If it is not available yet, the computation
+        is started in the background (unless already running).
+
+        :param max_columns: Maximum number of time columns to compute, see
+            :func:`compute_spectrogram`.
+        :param tag: Any hashable describing how the trace data was processed
+            (e.g. filter settings), used as part of the cache key.
+        """
+        key = self._key(tr, wlen, per_lap, max_columns, tag)
+        with self.lock:
+            result = self.results.pop(key, None)
+            if result is not None:
+                # re-insert to mark as recently used
+                self.results[key] = result
+                return result
+            if key in self.failed:
+                return FAILED
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        self.pool.apply_async(self._compute,
+                              (key, tr.id, tr.data, tr.stats.sampling_rate,
+                               wlen, per_lap, max_columns))
+        return None
+
+    def _compute(self, key, id, data, samp_rate, wlen, per_lap, max_columns):
+        try:
+            result = compute_spectrogram(data, samp_rate, wlen=wlen,
+                                         per_lap=per_lap,
+                                         max_columns=max_columns)
+        except Exception as e:
+            msg = "Error computing spectrogram for %s: %s: %s" % (
+                id, e.__class__.__name__, str(e))
+            with self.lock:
+                self.errors.append(msg)
+                # remember failed computations, so they are not retried
+                self.failed.add(key)
+                self.pending.discard(key)
+            return
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+            self.pending.discard(key)
+
+    def is_busy(self):
+        """
+        Returns True if any spectrogram is still being computed.
+        """
+        with self.lock:
+            return bool(self.pending)
+
+    def pop_errors(self):
+        """
+        Returns and forgets error messages of failed computations.
+        """
+        with self.lock:
+            errors = self.errors
+            self.errors = []
+        return errors
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.failed.clear()
+
+    def close(self):
+        self.pool.terminate()
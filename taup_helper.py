@@ -0,0 +1,258 @@
+import os
+import json
+import multiprocessing
+
+import numpy as np
+from obspy import UTCDateTime, fdsn, readEvents, __version__ as OBSPY_VERSION
+from obspy.taup.taup import getTravelTimes
+
+# spacing (degrees) of the distance grid theoretical arrivals are
+# interpolated on
+DISTANCE_STEP = 0.25
+# source depths (km) are rounded to this step to share tables between events
+DEPTH_STEP = 1.0
+# event query results for time windows ending less than this many seconds
+# ago are not cached, catalogs still change for recent events
+EVENT_CACHE_MIN_AGE = 24 * 3600
+# caches are plain JSON/QuakeML, so that a cache directory shared with
+# others can never run code when it is read
+TAUP_CACHE_FILENAME = "taup_tables.json"
+# bump when the content of the travel time cache changes, caches written by
+# other versions (or with another obspy version) are ignored
+TAUP_CACHE_VERSION = 3
+# missing grid nodes are computed in worker processes if there are at least
+# this many of them (e.g. the first lookup with an empty cache)
+MIN_PARALLEL_NODES = 16
+
+
+def locations2degrees(lat1, lon1, lat2, lon2):
+    """
+    Great circle distances in degrees, like
+    :func:`obspy.core.util.locations2degrees` but for arrays of coordinates.
+    """
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(x, dtype=np.float64))
+                              for x in (lat1, lon1, lat2, lon2)]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+def _load_cache(filename, version):
+    """
+    Returns the content of a JSON cache file written by :func:`_save_cache`
+    or None if it does not exist, can not be read or was written by another
+    cache format or obspy version.
+    """
+    try:
+        with open(filename, "rt") as fh:
+            data = json.load(fh)
+        if data['version'] != version or data['obspy'] != OBSPY_VERSION:
+            return None
+        return data['content']
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _replace(tmp, filename):
+    # caches are written to a temporary file first, so that an interrupted
+    # write does not leave a broken cache
+    if os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tmp, filename)
+
+
+def _save_cache(filename, version, content):
+    tmp = filename + ".tmp"
+    with open(tmp, "wt") as fh:
+        json.dump({'version': version, 'obspy': OBSPY_VERSION,
+                   'content': content}, fh)
+    _replace(tmp, filename)
+
+
+def _compute_node(args):
+    """
+    First travel time of every phase at one grid node, for given
+    (grid index, source depth).
+    """
+    index, depth = args
+    phases = {}
+    # sorted by time, keep the first arrival of every phase
+    for tt in getTravelTimes(index * DISTANCE_STEP, depth):
+        phases.setdefault(str(tt['phase_name']), float(tt['time']))
+    return phases
+
+
+def _compute_nodes(indices, depth):
+    """
+    Computes the grid nodes with given indices, in worker processes if there
+    are many of them.
+    """
+    args = [(index, depth) for index in indices]
+    if len(args) >= MIN_PARALLEL_NODES and multiprocessing.cpu_count() > 1:
+        try:
+            pool = multiprocessing.Pool()
+        except (OSError, ImportError):
+            pass
+        else:
+            try:
+                return pool.map(_compute_node, args)
+            finally:
+                pool.close()
+                pool.join()
+    return [_compute_node(args_) for args_ in args]
+
+
+class TheoreticalArrivalTable(object):
+    """
+    Travel times of all phases (see :func:`obspy.taup.taup.getTravelTimes`)
+    for one source depth on a regular distance grid. Travel times are only
+    computed for grid nodes that are actually needed and are interpolated
+    linearly in between, for any number of distances at once.
+    """
+    def __init__(self, depth, nodes=None):
+        """
+        :param depth: Source depth (km).
+        :param nodes: Travel times computed before (see :attr:`nodes`).
+        """
+        self.depth = depth
+        # grid index -> {phase name: travel time}
+        self.nodes = nodes or {}
+        self.modified = False
+
+    def arrivals(self, distances):
+        """
+        Returns for every given distance (degrees) a list of (phase name,
+        travel time) sorted by travel time. Phases are only given where they
+        exist at both neighbouring grid nodes.
+        """
+        f = np.asarray(distances, dtype=np.float64).ravel() / DISTANCE_STEP
+        last = int(round(180.0 / DISTANCE_STEP)) - 1
+        i = np.clip(np.floor(f).astype(np.int64), 0, last)
+        w = (f - i)[:, np.newaxis]
+        needed = np.union1d(i, i + 1)
+        missing = [index for index in needed.tolist()
+                   if index not in self.nodes]
+        if missing:
+            self.nodes.update(zip(missing,
+                                  _compute_nodes(missing, self.depth)))
+            self.modified = True
+        # travel times of all needed nodes (rows) and phases (columns)
+        phases = sorted(set().union(*[self.nodes[index]
+                                      for index in needed.tolist()]))
+        columns = dict((phase, n) for n, phase in enumerate(phases))
+        table = np.empty((len(needed), len(phases)), dtype=np.float64)
+        table.fill(np.nan)
+        for row, index in enumerate(needed.tolist()):
+            for phase, time in self.nodes[index].iteritems():
+                table[row, columns[phase]] = time
+        times = (1 - w) * table[np.searchsorted(needed, i)] + \
+            w * table[np.searchsorted(needed, i + 1)]
+        # NaNs (phase missing at a node) are sorted last
+        order = np.argsort(times, axis=1)
+        counts = (~np.isnan(times)).sum(axis=1)
+        ret = []
+        for times_, order_, count in zip(times.tolist(), order.tolist(),
+                                         counts.tolist()):
+            ret.append([(phases[n], times_[n]) for n in order_[:count]])
+        return ret
+
+
+class TheoreticalArrivalCache(object):
+    """
+    Theoretical arrival tables by (rounded) source depth, kept on disk in
+    given directory across sessions.
+    """
+    def __init__(self, cache_dir=None):
+        self.filename = None
+        self.tables = {}
+        if cache_dir:
+            self.filename = os.path.join(cache_dir, TAUP_CACHE_FILENAME)
+            content = _load_cache(self.filename, TAUP_CACHE_VERSION) or []
+            # JSON has string keys only, nodes are stored as lists
+            for depth, nodes in content:
+                nodes = dict((index, dict((str(phase), time)
+                                          for phase, time in phases.items()))
+                             for index, phases in nodes)
+                self.tables[depth] = TheoreticalArrivalTable(depth, nodes)
+
+    def get(self, depth):
+        depth = round(depth / DEPTH_STEP) * DEPTH_STEP
+        if depth not in self.tables:
+            self.tables[depth] = TheoreticalArrivalTable(depth)
+        return self.tables[depth]
+
+    def save(self):
+        """
+        Writes the tables to disk if new travel times were computed.
+        """
+        if self.filename is None:
+            return
+        if not any(table.modified for table in self.tables.itervalues()):
+            return
+        content = [(depth, table.nodes.items())
+                   for depth, table in self.tables.iteritems()]
+        _save_cache(self.filename, TAUP_CACHE_VERSION, content)
+        for table in self.tables.itervalues():
+            table.modified = False
+
+
+class LocalEventSource(object):
+    """
+    Stand-in for an FDSN web service serving the events of a local QuakeML
+    file or catalog, e.g. to work offline or in tests.
+    """
+    def __init__(self, catalog):
+        """
+        :param catalog: QuakeML file name or
+            :class:`~obspy.core.event.Catalog`.
+        """
+        if isinstance(catalog, basestring):
+            catalog = readEvents(catalog)
+        self.catalog = catalog
+
+    def get_events(self, starttime, endtime):
+        """
+        Returns catalog of the events with an origin time in given window,
+        see :meth:`obspy.fdsn.client.Client.get_events`.
+        """
+        catalog = self.catalog.copy()
+        catalog.events = [ev for ev in catalog
+                          if ev.origins and
+                          starttime <= ev.origins[0].time <= endtime]
+        return catalog
+
+
+def get_events(source, starttime, endtime, cache_dir=None):
+    """
+    Returns the events in given time window (see
+    :meth:`obspy.fdsn.client.Client.get_events`).
+
+    :param source: Name of an FDSN web service, name of a local QuakeML
+        file or an object with a `get_events(starttime, endtime)` method
+        (e.g. :class:`LocalEventSource`).
+    :param cache_dir: Results of FDSN web services are cached as files in
+        this directory per time window (except for recent time windows).
+    """
+    if isinstance(source, basestring) and os.path.isfile(source):
+        source = LocalEventSource(source)
+    if not isinstance(source, basestring):
+        return source.get_events(starttime, endtime)
+    client_name = source
+    filename = None
+    if cache_dir and UTCDateTime() - endtime > EVENT_CACHE_MIN_AGE:
+        filename = os.path.join(cache_dir, "events_%s_%s_%s.xml" % (
+            client_name, starttime.strftime("%Y%m%dT%H%M%S"),
+            endtime.strftime("%Y%m%dT%H%M%S")))
+        if os.path.isfile(filename):
+            try:
+                return readEvents(filename, format="QUAKEML")
+            # a broken cache file is just fetched again
+            except Exception:
+                pass
+    client = fdsn.Client(client_name)
+    events = client.get_events(starttime=starttime, endtime=endtime)
+    if filename is not None:
+        tmp = filename + ".tmp"
+        events.write(tmp, format="QUAKEML")
+        _replace(tmp, filename)
+    return events
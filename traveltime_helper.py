@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+import optparse
+import time
+import zipfile
+import zlib
+
+import numpy as np
+
+from gridsearch_helper import LayeredModel, DEFAULT_MODEL, \
+    read_velocity_model
+
+TABLE_VERSION = 1
+PHASES = ("P", "S")
+
+
+class TravelTimeTable(object):
+    """
+    Travel times and take-off angles of first P and S arrivals of a
+    :class:`gridsearch_helper.LayeredModel`, precomputed on a regular
+    distance x depth grid. Lookups interpolate bilinearly for whole arrays
+    of distances at once, so a table can be used wherever the model is
+    used (same :meth:`travel_times` interface), just a lot faster.
+
+    Tables can be stored as compact `.npz` files with :meth:`save` and
+    read back with :meth:`load`.
+    """
+    def __init__(self, model, max_distance=500.0, max_depth=50.0,
+                 distance_step=0.5, depth_step=0.25, _arrays=None):
+        """
+        :type model: :class:`gridsearch_helper.LayeredModel`
+        :param max_distance: Maximum epicentral distance (km) of the table,
+            times at larger distances are extrapolated linearly.
+        :param max_depth: Maximum source depth (km) of the table.
+        :param distance_step: Grid spacing in distance (km).
+        :param depth_step: Grid spacing in depth (km).
+        """
+        self.model = model
+        self.name = model.name
+        self.velocities = model.velocities
+        self.distance_step = float(distance_step)
+        self.depth_step = float(depth_step)
+        self.distances = np.arange(0, max_distance + distance_step / 2.0,
+                                   distance_step)
+        self.depths = np.arange(0, max_depth + depth_step / 2.0, depth_step)
+        if _arrays is not None:
+            self.times, self.takeoff_angles = _arrays
+            return
+        self.times = {}
+        self.takeoff_angles = {}
+        for phase in PHASES:
+            rows = [model.travel_times(phase, self.distances, depth)
+                    for depth in self.depths]
+            # single precision is plenty (well below a millisecond) and
+            # halves the file size
+            self.times[phase] = np.array([row[0] for row in rows],
+                                         dtype=np.float32)
+            self.takeoff_angles[phase] = np.array([row[1] for row in rows],
+                                                  dtype=np.float32)
+
+    def travel_times(self, phase, distances, depth):
+        """
+        Returns travel times (s) and take-off angles (degrees from vertical
+        down) of the first arrival of a phase, see
+        :meth:`gridsearch_helper.LayeredModel.travel_times`.
+
+        :param distances: Array of epicentral distances (km).
+        :param depth: Source depth (km), scalar or array broadcastable
+            against `distances`.
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        depth = np.asarray(depth, dtype=np.float64)
+        fd = distances / self.distance_step
+        fz = depth / self.depth_step
+        i = np.clip(np.floor(fd).astype(np.int64), 0, len(self.distances) - 2)
+        j = np.clip(np.floor(fz).astype(np.int64), 0, len(self.depths) - 2)
+        # weights are not clipped, i.e. values outside the table are
+        # extrapolated linearly from the last cell
+        wd = fd - i
+        wz = fz - j
+        table = self.times[phase]
+        times = (1 - wz) * ((1 - wd) * table[j, i] + wd * table[j, i + 1]) + \
+            wz * ((1 - wd) * table[j + 1, i] + wd * table[j + 1, i + 1])
+        # take-off angles jump where the head wave overtakes the direct
+        # wave, interpolating would mix up both, use the nearest node
+        i = np.clip(np.round(fd).astype(np.int64), 0, len(self.distances) - 1)
+        j = np.clip(np.round(fz).astype(np.int64), 0, len(self.depths) - 1)
+        return times, self.takeoff_angles[phase][j, i]
+
+    def matches(self, model):
+        """
+        Whether the table was computed for given model.
+        """
+        return all(np.array_equal(self.model.tops, model.tops) and
+                   np.array_equal(self.velocities[phase],
+                                  model.velocities[phase])
+                   for phase in PHASES)
+
+    def save(self, filename):
+        arrays = {'version': TABLE_VERSION, 'name': self.name,
+                  'tops': self.model.tops,
+                  'steps': [self.distance_step, self.depth_step],
+                  'limits': [self.distances[-1], self.depths[-1]]}
+        for phase in PHASES:
+            arrays['velocities_' + phase] = self.velocities[phase]
+            arrays['times_' + phase] = self.times[phase]
+            arrays['takeoff_angles_' + phase] = self.takeoff_angles[phase]
+        # np.savez appends .npz to other file names, use a file object
+        with open(filename, "wb") as fh:
+            np.savez_compressed(fh, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads a table stored with :meth:`save`.
+        """
+        data = np.load(filename)
+        if int(data['version']) != TABLE_VERSION:
+            msg = "Unsupported travel time table version: %s" % \
+                data['version']
+            raise ValueError(msg)
+        layers = zip(data['tops'], data['velocities_P'], data['velocities_S'])
+        model = LayeredModel(layers, str(data['name']))
+        times = {}
+        takeoff_angles = {}
+        for phase in PHASES:
+            times[phase] = data['times_' + phase]
+            takeoff_angles[phase] = data['takeoff_angles_' + phase]
+        max_distance, max_depth = data['limits']
+        distance_step, depth_step = data['steps']
+        return cls(model, max_distance, max_depth, distance_step, depth_step,
+                   _arrays=(times, takeoff_angles))
+
+
+def get_travel_time_table(model, filename=None):
+    """
+    Returns a travel time table for given model. If a file name is given,
+    the table is read from it if it was computed for the same model,
+    otherwise it is computed and stored in the file.
+    """
+    if filename is not None:
+        # corrupt or truncated files are recomputed like missing ones
+        try:
+            table = TravelTimeTable.load(filename)
+        except (IOError, EOFError, KeyError, ValueError, zipfile.BadZipfile,
+                zlib.error):
+            table = None
+        if table is not None and table.matches(model):
+            return table
+    table = TravelTimeTable(model)
+    if filename is not None:
+        table.save(filename)
+    return table
+
+
+def benchmark(model, stations=50, depths=100, repeat=3):
+    """
+    Compares table lookups with ray tracing in the layered model for every
+    station separately (as done before tables existed) for a number of
+    random stations and source depths.
+
+    :returns: List of (description, seconds), maximum difference of travel
+        times (s) and fraction of take-off angles off by more than a degree
+        (near the distances where the head wave overtakes the direct wave).
+    """
+    random = np.random.RandomState(42)
+    distances = random.uniform(0, 300, stations)
+    source_depths = random.uniform(0, 40, depths)
+    timings = []
+
+    start = time.time()
+    table = TravelTimeTable(model)
+    timings.append(("computing table", time.time() - start))
+
+    def per_station():
+        return [[model.travel_times(phase, distance, depth)
+                 for distance in distances for depth in source_depths]
+                for phase in PHASES]
+
+    def vectorized():
+        return [[model.travel_times(phase, distances, depth)
+                 for depth in source_depths] for phase in PHASES]
+
+    def lookup():
+        return [table.travel_times(phase, distances[np.newaxis, :],
+                                   source_depths[:, np.newaxis])
+                for phase in PHASES]
+
+    for description, func in (("ray tracing per station", per_station),
+                              ("ray tracing, all stations at once",
+                               vectorized),
+                              ("table lookup", lookup)):
+        best = None
+        for _ in xrange(repeat):
+            start = time.time()
+            func()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append((description, best))
+
+    max_time = 0.0
+    angles_off = 0
+    for phase, (times, angles) in zip(PHASES, lookup()):
+        for k, depth in enumerate(source_depths):
+            exact_times, exact_angles = model.travel_times(phase, distances,
+                                                           depth)
+            max_time = max(max_time, np.abs(times[k] - exact_times).max())
+            angles_off += (np.abs(angles[k] - exact_angles) > 1).sum()
+    return timings, max_time, float(angles_off) / (stations * depths *
+                                                   len(PHASES))
+
+
+def main():
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Benchmark travel time table lookups against ray "
+        "tracing in a layered velocity model.")
+    parser.add_option("--velocity-model", dest="velocity_model",
+                      default=None, help="Velocity model file (see "
+                      "gridsearch_helper.read_velocity_model), default "
+                      "model if not given.")
+    parser.add_option("--stations", dest="stations", type="int", default=50,
+                      help="Number of stations.")
+    parser.add_option("--depths", dest="depths", type="int", default=100,
+                      help="Number of source depths.")
+    (options, args) = parser.parse_args()
+    if options.velocity_model:
+        model = LayeredModel(read_velocity_model(options.velocity_model))
+    else:
+        model = LayeredModel(DEFAULT_MODEL)
+    timings, max_time, angles_off = benchmark(model, options.stations,
+                                              options.depths)
+    print "%i stations x %i source depths x %i phases:" % (
+        options.stations, options.depths, len(PHASES))
+    for description, seconds in timings:
+        print "  %-35s %9.4f s" % (description, seconds)
+    print "table lookup: maximum travel time difference %.4f s, " \
+        "%.1f%% of take-off angles off by more than 1 degree" % (
+            max_time, 100 * angles_off)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+
+import numpy as np
+from obspy import UTCDateTime, Stream, Trace
+from obspy.core.util import AttribDict
+
+STORE_VERSION = 1
+HEADER_FILENAME = "header.json"
+# command line options that determine the content of the store
+STORE_OPTIONS = ("time", "duration", "starttime_offset", "files", "dataless",
+                 "seishub_ids", "arclink_ids", "merge", "nozeromean",
+                 "nometadata", "precision", "verify_chksum")
+# stats that are derived from other stats or the data itself
+DERIVED_STATS = ("endtime", "delta", "npts")
+# names of the data files written by save_streams()
+DATA_FILENAME_PATTERN = re.compile(r"^\d+_\d+(_mask)?\.npy$")
+
+
+def _store_options(options):
+    return dict((key, getattr(options, key, None)) for key in STORE_OPTIONS)
+
+
+def encode_json_object(obj):
+    """
+    Encodes objects in trace stats (PAZ, coordinates, ...) that are not
+    natively supported by json, see :func:`decode_json_object`.
+    """
+    if isinstance(obj, UTCDateTime):
+        return {"__UTCDateTime__": str(obj)}
+    if isinstance(obj, complex):
+        return {"__complex__": [obj.real, obj.imag]}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, AttribDict):
+        return dict(obj)
+    raise TypeError("%s is not JSON serializable" % repr(obj))
+
+
+def decode_json_object(dct):
+    """
+    Decodes objects encoded by :func:`encode_json_object`, all other
+    dictionaries become :class:`~obspy.core.util.AttribDict`s with str keys.
+    """
+    if "__UTCDateTime__" in dct:
+        return UTCDateTime(dct["__UTCDateTime__"])
+    if "__complex__" in dct:
+        return complex(*dct["__complex__"])
+    new = AttribDict()
+    for key, value in dct.iteritems():
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        new[key.encode("utf-8")] = value
+    return new
+
+
+def save_streams(dirname, streams, options):
+    """
+    Writes the sample arrays of all traces as .npy files plus a JSON header
+    with the trace stats (including PAZ and coordinates) and the command
+    line options the data was obtained with into given directory.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    header_filename = os.path.join(dirname, HEADER_FILENAME)
+    # invalidate the store while the data files are rewritten
+    if os.path.exists(header_filename):
+        os.remove(header_filename)
+    header = {'version': STORE_VERSION, 'options': _store_options(options),
+              'streams': []}
+    filenames = set()
+    for i, st in enumerate(streams):
+        traces = []
+        for j, tr in enumerate(st):
+            item = {'data': "%i_%i.npy" % (i, j)}
+            filenames.add(item['data'])
+            np.save(os.path.join(dirname, item['data']),
+                    np.ma.getdata(tr.data))
+            if np.ma.isMaskedArray(tr.data):
+                item['mask'] = "%i_%i_mask.npy" % (i, j)
+                filenames.add(item['mask'])
+                np.save(os.path.join(dirname, item['mask']),
+                        np.ma.getmaskarray(tr.data))
+            item['stats'] = dict((key, value)
+                                 for key, value in tr.stats.iteritems()
+                                 if key not in DERIVED_STATS)
+            traces.append(item)
+        header['streams'].append(traces)
+    tmp_filename = header_filename + ".tmp"
+    with open(tmp_filename, "wt") as fh:
+        json.dump(header, fh, default=encode_json_object, indent=1)
+    os.rename(tmp_filename, header_filename)
+    # data files of a previous store with more stations/traces or masks
+    for filename in os.listdir(dirname):
+        if DATA_FILENAME_PATTERN.match(filename) and \
+                filename not in filenames:
+            os.remove(os.path.join(dirname, filename))
+
+
+def load_streams(dirname, options):
+    """
+    Opens the streams in a store written by :func:`save_streams`. Sample
+    arrays are memory-mapped read-only, so only the parts that are actually
+    accessed are read from disk.
+
+    :returns: list(:class:`obspy.core.stream.Stream`s) or None if there is no
+        valid store for the given command line options in the directory.
+    """
+    header_filename = os.path.join(dirname, HEADER_FILENAME)
+    if not os.path.isfile(header_filename):
+        return None
+    try:
+        with open(header_filename, "rt") as fh:
+            header = json.load(fh, object_hook=decode_json_object)
+    except ValueError:
+        return None
+    if header.get("version") != STORE_VERSION:
+        return None
+    if dict(header.get("options", {})) != _store_options(options):
+        return None
+    streams = []
+    for traces in header.streams:
+        st = Stream()
+        for item in traces:
+            data = np.load(os.path.join(dirname, item.data), mmap_mode="r")
+            if "mask" in item:
+                mask = np.load(os.path.join(dirname, item.mask),
+                               mmap_mode="r")
+                data = np.ma.masked_array(data, mask=mask)
+            st.append(Trace(data=data, header=item.stats))
+        streams.append(st)
+    return streams